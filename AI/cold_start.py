@@ -0,0 +1,95 @@
+import os
+import re
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+
+# Imported on first use by the services, see AI_PRELOAD to load them at boot
+HEAVY_MODULES = [
+    "sklearn.ensemble",
+    "sklearn.preprocessing",
+    "joblib",
+    "yfinance",
+    "textblob",
+    "bs4",
+    "nltk.sentiment.vader",
+    "groq",
+]
+# Warm every heavy dependency during startup instead of on the first request
+AI_PRELOAD = os.getenv("AI_PRELOAD", "0") == "1"
+# Seconds "import server" may take in a fresh interpreter
+COLD_START_BUDGET = float(os.getenv("COLD_START_BUDGET", "2.5"))
+
+
+def preload():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    from sentiment import sentiment_engine
+
+    sentiment_engine.analyzer
+
+
+def provision():
+    """Download the VADER lexicon into NLTK_DATA_DIR, e.g. at image build time."""
+    from sentiment import NLTK_DATA_DIR, ensure_vader_lexicon
+
+    ensure_vader_lexicon(download=True)
+    print(f"vader_lexicon available in {NLTK_DATA_DIR}")
+
+
+def measure(module, runs):
+    """Return (best wall time, slowest imports) of importing module cold."""
+    best = None
+    report = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+        if best is None or elapsed < best:
+            best, report = elapsed, result.stderr
+
+    # "import time: self [us] | cumulative | imported package"
+    top_level = []
+    for line in report.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and len(match.group(2)) <= 2:
+            top_level.append((int(match.group(1)) / 1e6, match.group(3)))
+    return best, sorted(top_level, reverse=True)[:10]
+
+
+def benchmark(module="server", budget=COLD_START_BUDGET, runs=3):
+    elapsed, slowest = measure(module, runs)
+    print(f"import {module}: {elapsed:.2f}s (budget {budget:.2f}s, best of {runs})")
+    for seconds, name in slowest:
+        print(f"  {seconds:6.3f}s  {name}")
+    return elapsed <= budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cold start tooling for the AI services."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("provision", help="download the VADER lexicon")
+    bench = subparsers.add_parser(
+        "import-time", help="fail if importing the app exceeds the budget"
+    )
+    bench.add_argument("--module", default="server")
+    bench.add_argument("--budget", type=float, default=COLD_START_BUDGET)
+    bench.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "provision":
+        provision()
+    elif not benchmark(args.module, args.budget, args.runs):
+        print("Cold start budget exceeded")
+        sys.exit(1)
@@ -0,0 +1,6 @@
+import os
+
+# Root directory for the on-disk caches and stores shared by the AI services
+CACHE_DIR = os.getenv(
+    "AI_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+FEATURES = ["log_returns", "volatility", "ma_50", "ma_200", "volume"]
+# Rows between a feature row and the volatility used as its training target
+HORIZON = 30
+
+
+class FeaturePanel:
+    """Risk-model features for many symbols, computed in one pass.
+
+    Prices are aligned into (dates x symbols) frames and every rolling
+    statistic is computed once over the whole panel. The result is a single
+    (dates, symbols, features) array; per-symbol matrices are slices of it.
+
+    For a symbol without holes in its history the rows match
+    risk_models.build_features exactly. A date missing inside a symbol's
+    history (while other symbols trade) makes every window spanning it NaN,
+    so mix calendars (e.g. crypto and NSE) through build_panels instead.
+    """
+
+    def __init__(self, frames):
+        """frames maps symbol -> DataFrame with Close and Volume columns."""
+        self.symbols = list(frames)
+        self._columns = {symbol: j for j, symbol in enumerate(self.symbols)}
+        close = pd.concat({s: f["Close"] for s, f in frames.items()}, axis=1)
+        close = close.sort_index()
+        volume = pd.concat({s: f["Volume"] for s, f in frames.items()}, axis=1)
+        volume = volume.reindex(close.index)
+        self.index = close.index
+
+        # No fill across NaNs, so a symbol's first return is NaN as in pct_change
+        returns = close / close.shift(1) - 1
+        volatility = returns.rolling(window=30).std() * np.sqrt(252)
+        self.values = np.stack(
+            [
+                np.log(1 + returns).to_numpy(),
+                volatility.to_numpy(),
+                close.rolling(window=50).mean().to_numpy(),
+                close.rolling(window=200).mean().to_numpy(),
+                volume.to_numpy(dtype=float),
+            ],
+            axis=-1,
+        )
+        self.volatility = self.values[:, :, FEATURES.index("volatility")]
+        self._valid = np.isfinite(self.values).all(axis=2)
+        self._has_close = close.notna().to_numpy()
+
+    @staticmethod
+    def _take(array, rows):
+        # Basic slicing (a view) when the rows are contiguous, a copy otherwise
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            return array[rows[0] : rows[-1] + 1]
+        return array[rows]
+
+    def _rows(self, symbol):
+        j = self._columns[symbol]
+        feature_rows = np.flatnonzero(self._valid[:, j])
+        # Same positional target as build_features: volatility starting one
+        # horizon after the symbol's first return
+        close_rows = np.flatnonzero(self._has_close[:, j])
+        target_rows = close_rows[HORIZON + 1 :]
+        n = min(max(len(feature_rows) - HORIZON, 0), len(target_rows))
+        return j, feature_rows[:n], target_rows[:n], close_rows[1 : n + 1]
+
+    def arrays(self, symbol):
+        """Return (features, future_volatility) arrays for one symbol."""
+        j, feature_rows, target_rows, _ = self._rows(symbol)
+        features = self._take(self.values[:, j, :], feature_rows)
+        target = self._take(self.volatility[:, j], target_rows)
+        return features, target
+
+    def frame(self, symbol):
+        """Return (features, future_volatility) shaped like build_features."""
+        j, feature_rows, target_rows, target_dates = self._rows(symbol)
+        features = self._take(self.values[:, j, :], feature_rows)
+        target = self._take(self.volatility[:, j], target_rows)
+        return (
+            pd.DataFrame(
+                features, index=self.index[feature_rows], columns=FEATURES, copy=False
+            ),
+            # Indexed like volatility.shift(-30): by the date the value moved to
+            pd.Series(target, index=self.index[target_dates], copy=False),
+        )
+
+
+def build_panels(frames):
+    """Split frames into FeaturePanels whose symbols share a trading calendar.
+
+    A symbol joins a panel when its dates are a contiguous run of the
+    panel's longest history, so late listings share a panel with the rest
+    of their exchange while e.g. crypto (trading on weekends) gets its own.
+    """
+    groups = []
+    for symbol in sorted(frames, key=lambda s: len(frames[s]), reverse=True):
+        dates = pd.DatetimeIndex(frames[symbol].index)
+        if dates.empty:
+            continue
+        for reference, members in groups:
+            run = reference[reference.slice_indexer(dates[0], dates[-1])]
+            if run.equals(dates):
+                members[symbol] = frames[symbol]
+                break
+        else:
+            groups.append((dates, {symbol: frames[symbol]}))
+    return [FeaturePanel(members) for _, members in groups]
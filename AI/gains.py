@@ -0,0 +1,193 @@
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Holding period, in days, from which a gain is long term
+LONG_TERM_DAYS = 365
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def to_days(dates):
+    """datetime64[D] array of YYYY-MM-DD strings, dates or datetimes.
+
+    Strings are parsed as strictly as datetime.strptime(DATE_FORMAT) did:
+    "", "2024" or "2024-01" raise ValueError instead of becoming NaT or
+    the first of the year/month.
+    """
+    values = np.asarray(dates)
+    if values.dtype.kind == "O" and not any(isinstance(v, str) for v in values.flat):
+        values = values.astype("datetime64[D]")
+    if values.dtype.kind == "M":
+        days = values.astype("datetime64[D]")
+    else:
+        days = _parse_days(values.astype(str).reshape(-1)).reshape(values.shape)
+    invalid = np.isnat(days)
+    if invalid.any():
+        bad = values[invalid].flat[0]
+        raise ValueError(
+            f"time data {str(bad)!r} does not match format {DATE_FORMAT!r}"
+        )
+    return days
+
+
+def _parse_days(strings):
+    if len(strings) and (np.char.str_len(strings) == 10).all():
+        chars = strings.astype("U10").view("U1").reshape(-1, 10)
+        digits = np.delete(chars, [4, 7], axis=1)
+        if (chars[:, [4, 7]] == "-").all() and np.char.isdigit(digits).all():
+            try:
+                return strings.astype("datetime64[D]")
+            except ValueError:
+                # Impossible days such as 2024-02-30 become NaT below
+                pass
+    # strptime also took unpadded dates such as 2024-1-5, the rest become NaT
+    parsed = pd.to_datetime(
+        pd.Series(strings, dtype=object), format=DATE_FORMAT, errors="coerce"
+    )
+    return parsed.values.astype("datetime64[D]")
+
+
+def capital_gains(
+    buy_prices, sell_prices, buy_dates, sell_dates, asset_types, quantities=None
+):
+    """Columnar gains of a set of lots sold (or valued) at sell_prices on sell_dates.
+
+    sell_dates may be a single date. Returns arrays of the profit per unit,
+    the total profit, the holding period in days and whether it is long term.
+    """
+    buy_prices = np.asarray(buy_prices, dtype=float)
+    sell_prices = np.asarray(sell_prices, dtype=float)
+    profit_per_unit = sell_prices - buy_prices
+    quantities = (
+        np.ones(len(buy_prices)) if quantities is None else np.asarray(quantities)
+    )
+    holding_days = (to_days(sell_dates) - to_days(buy_dates)).astype(np.int64)
+    return {
+        "profit_per_unit": profit_per_unit,
+        "profit": profit_per_unit * quantities,
+        "holding_days": holding_days,
+        "long_term": holding_days >= LONG_TERM_DAYS,
+        "is_stock": np.asarray(asset_types, dtype=object) == "stock",
+    }
+
+
+def gains_buckets(gains):
+    """(LTCG, STCG) totals over the profitable stock lots of capital_gains output."""
+    taxable = gains["is_stock"] & (gains["profit"] > 0)
+    ltcg = gains["profit"][taxable & gains["long_term"]].sum()
+    stcg = gains["profit"][taxable & ~gains["long_term"]].sum()
+    return float(ltcg), float(stcg)
+
+
+def sales_gains(sales):
+    """capital_gains of validated Sale models, one unit each."""
+    return capital_gains(
+        [s.buy_price for s in sales],
+        [s.sale_price for s in sales],
+        [s.buy_date for s in sales],
+        [s.sale_date for s in sales],
+        [s.type for s in sales],
+    )
+
+
+def asset_gains(assets, current_date):
+    """capital_gains of validated Asset models valued at their current price."""
+    return capital_gains(
+        [a.buy_price for a in assets],
+        [a.current_price for a in assets],
+        [a.buy_date for a in assets],
+        np.datetime64(current_date, "D"),
+        [a.type for a in assets],
+        [a.total_stocks for a in assets],
+    )
+
+
+def reference_buckets(sales):
+    """The previous per-row strptime loop, kept for the benchmark."""
+    total_ltcg = 0
+    total_stcg = 0
+    one_year = timedelta(days=LONG_TERM_DAYS)
+    for sale in sales:
+        sale_date = datetime.strptime(sale["sale_date"], DATE_FORMAT)
+        buy_date = datetime.strptime(sale["buy_date"], DATE_FORMAT)
+        profit = sale["sale_price"] - sale["buy_price"]
+        if sale["type"] == "stock" and profit > 0:
+            if sale_date - buy_date >= one_year:
+                total_ltcg += profit
+            else:
+                total_stcg += profit
+    return total_ltcg, total_stcg
+
+
+def synthetic_sales(n, seed=0):
+    rng = np.random.default_rng(seed)
+    buy = np.datetime64("2015-01-01") + rng.integers(0, 3000, n)
+    sale = buy + rng.integers(1, 1500, n)
+    buy_price = rng.uniform(10, 500, n).round(2)
+    sale_price = (buy_price * rng.uniform(0.6, 1.8, n)).round(2)
+    types = rng.choice(["stock", "bond", "mutual_fund"], n, p=[0.7, 0.2, 0.1])
+    return [
+        {
+            "name": f"S{i % 500}",
+            "buy_price": float(bp),
+            "sale_price": float(sp),
+            "buy_date": str(b),
+            "sale_date": str(s),
+            "type": str(t),
+        }
+        for i, (bp, sp, b, s, t) in enumerate(
+            zip(buy_price, sale_price, buy, sale, types)
+        )
+    ]
+
+
+def benchmark(n=100000, runs=3):
+    from tax_saving import PastSales
+
+    rows = synthetic_sales(n)
+    past_sales = PastSales(sales=rows)
+
+    def best(func):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    def json_loop():
+        # What process_past_sales did: serialize, parse again, loop
+        import json
+
+        return reference_buckets(json.loads(past_sales.model_dump_json())["sales"])
+
+    loop_time, expected = best(json_loop)
+    columnar_time, result = best(lambda: gains_buckets(sales_gains(past_sales.sales)))
+    columns = [
+        np.array([r["buy_price"] for r in rows]),
+        np.array([r["sale_price"] for r in rows]),
+        to_days([r["buy_date"] for r in rows]),
+        to_days([r["sale_date"] for r in rows]),
+        np.array([r["type"] for r in rows]),
+    ]
+    engine_time, _ = best(lambda: gains_buckets(capital_gains(*columns)))
+    same = np.allclose(expected, result)
+    print(f"{n} lots, best of {runs}")
+    print(f"  json round trip + strptime loop: {loop_time * 1000:8.1f}ms")
+    print(f"  columnar from Pydantic models:   {columnar_time * 1000:8.1f}ms")
+    print(f"  columnar from datetime64 arrays: {engine_time * 1000:8.1f}ms")
+    print(f"  totals match: {same} {result}")
+    return same
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the columnar gains engine against the row loop."
+    )
+    parser.add_argument("--lots", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    raise SystemExit(0 if benchmark(args.lots, args.runs) else 1)
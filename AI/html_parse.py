@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+from lxml import etree
+
+# Bytes of a finviz quote page read before giving up on #news-table
+FINVIZ_MAX_BYTES = int(os.getenv("FINVIZ_MAX_BYTES", str(2 * 1024 * 1024)))
+# Bytes of an article read before the text gathered so far is used
+ARTICLE_MAX_BYTES = int(os.getenv("ARTICLE_MAX_BYTES", str(1024 * 1024)))
+NEWS_TABLE_ID = "news-table"
+
+
+def _text(element):
+    return element.xpath("string()")
+
+
+class NewsTableParser:
+    """Incremental parser for the rows of finviz's #news-table.
+
+    feed() returns True once limit rows have been read or the table has
+    closed, so the rest of the page never needs to be downloaded. close()
+    returns (date text, headline, link) for each of those rows that has a
+    link, in page order.
+    """
+
+    def __init__(self, limit=5, encoding=None):
+        self.limit = limit
+        self.rows = []
+        self.done = False
+        self._seen = 0
+        self._parser = etree.HTMLPullParser(
+            events=("end",), tag=("tr", "table"), encoding=encoding
+        )
+
+    def feed(self, chunk):
+        if self.done:
+            return True
+        self._parser.feed(chunk)
+        for _, element in self._parser.read_events():
+            table = next(element.iterancestors("table"), None)
+            if element.tag == "table":
+                if element.get("id") == NEWS_TABLE_ID:
+                    self.done = True
+                    break
+            elif table is not None and table.get("id") == NEWS_TABLE_ID:
+                self._seen += 1
+                self._add(element)
+                if self._seen >= self.limit:
+                    self.done = True
+                    break
+        return self.done
+
+    def _add(self, row):
+        link = row.find(".//a")
+        cell = row.find(".//td")
+        if link is None or cell is None:
+            return
+        self.rows.append((_text(cell), _text(link), link.get("href")))
+
+    def close(self):
+        return self.rows
+
+
+class ParagraphParser:
+    """Incremental parser joining the text of every <p>, as the summaries expect."""
+
+    def __init__(self, encoding=None):
+        self.paragraphs = []
+        self._parser = etree.HTMLPullParser(events=("end",), tag="p", encoding=encoding)
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+        self._drain()
+        return False
+
+    def _drain(self):
+        for _, element in self._parser.read_events():
+            self.paragraphs.append(_text(element))
+            # Paragraph subtrees are not needed once their text is taken
+            element.clear(keep_tail=True)
+
+    def close(self):
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        self._drain()
+        return " ".join(self.paragraphs)
+
+
+def parse_news_table(html, limit=5, encoding=None):
+    parser = NewsTableParser(limit, encoding)
+    parser.feed(html)
+    return parser.close()
+
+
+def parse_paragraphs(html, encoding=None):
+    parser = ParagraphParser(encoding)
+    parser.feed(html)
+    return parser.close()
+
+
+def soup_news_table(html, limit=5):
+    """BeautifulSoup reference for parse_news_table, used by the benchmark."""
+    from bs4 import BeautifulSoup
+
+    table = BeautifulSoup(html, features="lxml").find(id=NEWS_TABLE_ID)
+    rows = []
+    for row in table.find_all("tr")[:limit]:
+        if row.a is not None and row.td is not None:
+            rows.append((row.td.text, row.a.get_text(), row.a["href"]))
+    return rows
+
+
+def soup_paragraphs(html):
+    """BeautifulSoup reference for parse_paragraphs, used by the benchmark."""
+    from bs4 import BeautifulSoup
+
+    paragraphs = BeautifulSoup(html, features="lxml").find_all("p")
+    return " ".join([para.get_text() for para in paragraphs])
+
+
+def synthetic_pages(rows=100, paragraphs=200, filler=4000):
+    """A finviz-like quote page and an article, for when no fixtures are saved."""
+    noise = "".join(
+        f"<div class='snapshot'><span>Metric {i}</span><b>{i * 1.5}</b></div>"
+        for i in range(filler)
+    )
+    news_rows = "".join(
+        f"<tr><td width='130' align='right'>Oct-{1 + i % 28:02d}-24 09:{i % 60:02d}AM</td>"
+        f"<td align='left'><div class='news-link-left'><a class='tab-link-news' "
+        f"href='https://example.com/a/{i}'>Company &amp; markets headline {i}</a>"
+        f"</div><span>(Source)</span></td></tr>"
+        for i in range(rows)
+    )
+    finviz = (
+        f"<html><head><title>Quote</title></head><body>{noise}"
+        f"<table id='{NEWS_TABLE_ID}' class='fullview-news-outer'>{news_rows}</table>"
+        f"{noise}</body></html>"
+    )
+    article = (
+        "<html><body><nav>"
+        + "<a href='#'>menu</a>" * 500
+        + "</nav>"
+        + "".join(
+            f"<p>Paragraph {i} with <b>bold</b> and <a href='#'>a link</a>.</p>"
+            f"<div class='ad'><script>var x = {i};</script></div>"
+            for i in range(paragraphs)
+        )
+        + "</body></html>"
+    )
+    return {"finviz": [finviz.encode()], "articles": [article.encode()]}
+
+
+def load_fixtures(directory):
+    """Pages saved as <directory>/finviz/*.html and <directory>/articles/*.html."""
+    pages = {}
+    for kind in ("finviz", "articles"):
+        folder = os.path.join(directory, kind)
+        names = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        pages[kind] = []
+        for name in names:
+            with open(os.path.join(folder, name), "rb") as f:
+                pages[kind].append(f.read())
+    return pages
+
+
+def _best(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings)
+
+
+def benchmark(pages, runs=5, chunk_size=65536):
+    """Time the BeautifulSoup path against the lxml parsers, checking they agree."""
+
+    def chunked(parser, html):
+        for i in range(0, len(html), chunk_size):
+            if parser.feed(html[i : i + chunk_size]):
+                break
+        return parser.close()
+
+    cases = {
+        "finviz": (
+            lambda html: soup_news_table(html.decode("utf-8", "replace")),
+            lambda html: chunked(NewsTableParser(encoding="utf-8"), html),
+        ),
+        "articles": (
+            lambda html: soup_paragraphs(html.decode("utf-8", "replace")),
+            lambda html: chunked(ParagraphParser(encoding="utf-8"), html),
+        ),
+    }
+    ok = True
+    for kind, (soup, lxml_path) in cases.items():
+        for index, html in enumerate(pages.get(kind, [])):
+            same = soup(html) == lxml_path(html)
+            ok = ok and same
+            soup_best, soup_median = _best(lambda: soup(html), runs)
+            lxml_best, lxml_median = _best(lambda: lxml_path(html), runs)
+            print(
+                f"{kind}[{index}] {len(html) / 1024:.0f} KiB: "
+                f"bs4 {soup_best * 1000:.1f}ms (median {soup_median * 1000:.1f}), "
+                f"lxml {lxml_best * 1000:.1f}ms (median {lxml_median * 1000:.1f}), "
+                f"x{soup_best / lxml_best:.1f}{'' if same else ', OUTPUT DIFFERS'}"
+            )
+    return ok
+
+
+async def record(tickers, directory):
+    """Save the finviz quote pages of tickers as fixtures."""
+    from http_client import http_client
+    from news import FINVIZ_URL
+
+    folder = os.path.join(directory, "finviz")
+    os.makedirs(folder, exist_ok=True)
+    try:
+        for ticker in tickers:
+            html = await http_client.get_bytes(FINVIZ_URL + ticker)
+            with open(os.path.join(folder, f"{ticker}.html"), "wb") as f:
+                f.write(html)
+            print(f"saved {ticker} ({len(html)} bytes)")
+    finally:
+        await http_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the lxml news parsers with BeautifulSoup."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark")
+    bench.add_argument("--fixtures", help="directory with finviz/ and articles/ pages")
+    bench.add_argument("--runs", type=int, default=5)
+    rec = sub.add_parser("record")
+    rec.add_argument("tickers", nargs="+")
+    rec.add_argument("--fixtures", required=True)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(record(args.tickers, args.fixtures))
+    else:
+        pages = load_fixtures(args.fixtures) if args.fixtures else synthetic_pages()
+        sys.exit(0 if benchmark(pages, args.runs) else 1)
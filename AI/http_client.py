@@ -0,0 +1,135 @@
+import os
+import random
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import aiohttp
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+# Base delay in seconds, doubled on each retry
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+HTTP_CHUNK_SIZE = 65536
+HTTP_DEFAULT_HOST_LIMIT = int(os.getenv("HTTP_DEFAULT_HOST_LIMIT", "10"))
+# In-flight request limits per host (subdomains included)
+HOST_LIMITS = {"finviz.com": int(os.getenv("FINVIZ_CONCURRENCY", "4"))}
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableStatus(Exception):
+    pass
+
+
+class HttpClient:
+    """App-lifetime aiohttp session with pooling, host limits and retries.
+
+    The session is created lazily inside the running event loop and
+    recreated if the loop changes, so scripts using asyncio.run also work.
+    """
+
+    def __init__(
+        self,
+        timeout=HTTP_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        retries=HTTP_RETRIES,
+        backoff=HTTP_BACKOFF,
+        host_limits=None,
+    ):
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.host_limits = HOST_LIMITS if host_limits is None else host_limits
+        self._session = None
+        self._loop = None
+        self._semaphores = {}
+
+    def session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                ttl_dns_cache=HTTP_DNS_TTL,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT},
+            )
+            self._loop = loop
+            self._semaphores = {}
+        return self._session
+
+    def _semaphore(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self._semaphores:
+            limit = HTTP_DEFAULT_HOST_LIMIT
+            for domain, domain_limit in self.host_limits.items():
+                if host == domain or host.endswith("." + domain):
+                    limit = domain_limit
+            self._semaphores[host] = asyncio.Semaphore(limit)
+        return self._semaphores[host]
+
+    async def _get(self, url, read, **kwargs):
+        session = self.session()
+        semaphore = self._semaphore(url)
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    async with session.get(url, **kwargs) as resp:
+                        if resp.status in RETRY_STATUSES:
+                            raise RetryableStatus(f"HTTP {resp.status} from {url}")
+                        resp.raise_for_status()
+                        return await read(resp)
+            except (
+                RetryableStatus,
+                aiohttp.ClientConnectionError,
+                asyncio.TimeoutError,
+            ) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt + random.uniform(0, self.backoff)
+                logging.warning(f"Retrying {url} in {delay:.2f}s after: {e!r}")
+                await asyncio.sleep(delay)
+
+    async def get_text(self, url, **kwargs):
+        return await self._get(url, lambda resp: resp.text(), **kwargs)
+
+    async def get_bytes(self, url, **kwargs):
+        return await self._get(url, lambda resp: resp.read(), **kwargs)
+
+    async def get_parsed(self, url, make_parser, max_bytes, **kwargs):
+        """Stream the body into make_parser(charset) and return its close().
+
+        Reading stops as soon as the parser's feed() returns True or after
+        max_bytes, whichever comes first. Each retry starts a new parser.
+        """
+
+        async def read(resp):
+            parser = make_parser(resp.charset)
+            received = 0
+            async for chunk in resp.content.iter_chunked(HTTP_CHUNK_SIZE):
+                received += len(chunk)
+                if parser.feed(chunk[: len(chunk) - max(received - max_bytes, 0)]):
+                    break
+                if received >= max_bytes:
+                    logging.info(f"Stopped reading {url} after {max_bytes} bytes")
+                    break
+            return parser.close()
+
+        return await self._get(url, read, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Shared by every scrape path of the process
+http_client = HttpClient()
@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+# "groq" for the real API, "stub" for canned local answers
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+# Requests to the LLM in flight at once across the process
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+# Seconds before a single completion is abandoned
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_STUB_RESPONSE = os.getenv(
+    "LLM_STUB_RESPONSE", '{\n"summary": [\n"Stub response"\n]\n}'
+)
+
+# Characters per chunk when the stub backend streams
+STUB_CHUNK_SIZE = 16
+
+DEFAULT_PARAMS = {
+    "temperature": 1,
+    "max_tokens": 8192,
+    "top_p": 1,
+    "stop": None,
+}
+
+
+class GroqBackend:
+    """Groq chat completions through one lazily created AsyncGroq client."""
+
+    def __init__(self):
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            from groq import AsyncGroq
+
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                raise ValueError(
+                    "GROQ_API_KEY is not set in the environment variables."
+                )
+            self._client = AsyncGroq(api_key=api_key)
+        return self._client
+
+    async def complete(self, prompt, **params):
+        completion = await self.client().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}], stream=False, **params
+        )
+        return completion.choices[0].message.content
+
+    async def stream(self, prompt, **params):
+        chunks = await self.client().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}], stream=True, **params
+        )
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubBackend:
+    """Answers locally with responder(prompt, **params), for tests and offline runs."""
+
+    def __init__(self, responder=None):
+        self.responder = responder or (lambda prompt, **params: LLM_STUB_RESPONSE)
+        self.calls = []
+
+    async def complete(self, prompt, **params):
+        self.calls.append((prompt, params))
+        result = self.responder(prompt, **params)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def stream(self, prompt, **params):
+        response = await self.complete(prompt, **params)
+        for start in range(0, len(response), STUB_CHUNK_SIZE):
+            yield response[start : start + STUB_CHUNK_SIZE]
+
+
+def default_backend():
+    if LLM_BACKEND == "stub":
+        return StubBackend()
+    if LLM_BACKEND == "groq":
+        return GroqBackend()
+    raise ValueError(f"Unsupported LLM backend: {LLM_BACKEND}")
+
+
+class LLMGateway:
+    """Single entry point for LLM calls from every service.
+
+    Caps in-flight requests, applies a per-call timeout and keeps call,
+    error, timeout and latency counters. Failures are logged and returned
+    as None, which is what the callers already handle.
+    """
+
+    def __init__(
+        self, backend=None, max_in_flight=LLM_MAX_IN_FLIGHT, timeout=LLM_TIMEOUT
+    ):
+        self.backend = backend or default_backend()
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.stats = {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "in_flight": 0,
+            "total_latency": 0.0,
+        }
+
+    async def complete(self, prompt, model=LLM_MODEL, **params):
+        params = {**DEFAULT_PARAMS, **params}
+        async with self._semaphore:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            start = time.perf_counter()
+            try:
+                return await asyncio.wait_for(
+                    self.backend.complete(prompt, model=model, **params),
+                    self.timeout,
+                )
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                logging.error(f"LLM call to {model} timed out after {self.timeout}s")
+                return None
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"An error occurred: {e}")
+                return None
+            finally:
+                self.stats["in_flight"] -= 1
+                self.stats["total_latency"] += time.perf_counter() - start
+
+    async def stream(self, prompt, model=LLM_MODEL, **params):
+        """Yield the completion as text deltas.
+
+        Unlike complete, failures are logged and re-raised, since the caller
+        may already have consumed part of the answer.
+        """
+        params = {**DEFAULT_PARAMS, **params}
+        async with self._semaphore:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            start = time.perf_counter()
+            deltas = self.backend.stream(prompt, model=model, **params)
+            try:
+                while True:
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    try:
+                        delta = await asyncio.wait_for(
+                            deltas.__anext__(), max(remaining, 0)
+                        )
+                    except StopAsyncIteration:
+                        break
+                    yield delta
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                logging.error(
+                    f"LLM stream from {model} timed out after {self.timeout}s"
+                )
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"An error occurred: {e}")
+                raise
+            finally:
+                await deltas.aclose()
+                self.stats["in_flight"] -= 1
+                self.stats["total_latency"] += time.perf_counter() - start
+
+
+# Shared by news.py and portfolio_summarizer.py
+llm_gateway = LLMGateway()
@@ -0,0 +1,132 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel, model_validator
+
+from gains import capital_gains, to_days
+
+LOT_DTYPE = np.dtype(
+    [
+        ("symbol", np.int32),
+        ("lot_id", np.int64),
+        ("quantity", np.float64),
+        ("buy_price", np.float64),
+        ("buy_date", "datetime64[D]"),
+    ]
+)
+LOT_METHODS = ("fifo", "specific")
+
+
+class LotColumns(BaseModel):
+    """Tax lots sent column-wise: the i-th entry of every list is lot i.
+
+    Validating a few flat lists is far cheaper than one model per lot.
+    lot_id defaults to the lot's position. current_price is per symbol and
+    only needed by the tax service.
+    """
+
+    symbol: List[str]
+    type: List[str]
+    quantity: List[float]
+    buy_price: List[float]
+    buy_date: List[str]
+    lot_id: Optional[List[int]] = None
+    current_price: Dict[str, float] = {}
+
+    @model_validator(mode="after")
+    def same_lengths(self):
+        columns = ["symbol", "type", "quantity", "buy_price", "buy_date"]
+        if self.lot_id is not None:
+            columns.append("lot_id")
+        lengths = {name: len(getattr(self, name)) for name in columns}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"Lot columns differ in length: {lengths}")
+        return self
+
+
+class LotStore:
+    """Lots of a portfolio in one structured array, grouped by symbol.
+
+    Lots are sorted by (symbol, buy_date, lot_id), so each symbol's lots are
+    a contiguous slice in FIFO order, bounded by offsets. Symbol names and
+    asset types are kept once per symbol, so a symbol's lots must all have
+    the same type.
+    """
+
+    def __init__(self, symbols, types, lots):
+        self.symbols = list(symbols)
+        self.types = np.asarray(types, dtype=object)
+        self.lots = lots
+        self.offsets = np.searchsorted(lots["symbol"], np.arange(len(symbols) + 1))
+
+    @classmethod
+    def from_columns(
+        cls, symbol, type, quantity, buy_price, buy_date, lot_id=None, **_
+    ):
+        symbols, first, codes = np.unique(
+            np.asarray(symbol, dtype=object), return_index=True, return_inverse=True
+        )
+        lots = np.empty(len(codes), dtype=LOT_DTYPE)
+        lots["symbol"] = codes
+        lots["lot_id"] = np.arange(len(codes)) if lot_id is None else lot_id
+        lots["quantity"] = quantity
+        lots["buy_price"] = buy_price
+        lots["buy_date"] = to_days(buy_date)
+        lots = lots[np.lexsort((lots["lot_id"], lots["buy_date"], lots["symbol"]))]
+        lot_types = np.asarray(type, dtype=object)
+        types = lot_types[first]
+        mixed = np.unique(codes[lot_types != types[codes]])
+        if len(mixed):
+            raise ValueError(
+                f"Lots of {symbols[mixed].tolist()} have more than one asset type"
+            )
+        return cls(symbols.tolist(), types, lots)
+
+    @classmethod
+    def from_payload(cls, payload: LotColumns):
+        return cls.from_columns(**payload.model_dump())
+
+    def __len__(self):
+        return len(self.lots)
+
+    def totals(self):
+        """Units held per symbol, aligned with self.symbols."""
+        return np.bincount(
+            self.lots["symbol"],
+            weights=self.lots["quantity"],
+            minlength=len(self.symbols),
+        )
+
+    def gains(self, current_prices, current_date):
+        """gains.capital_gains of every lot valued at its symbol's current price."""
+        missing = [s for s in self.symbols if s not in current_prices]
+        if missing:
+            raise ValueError(f"No current price for {missing}")
+        prices = np.array([current_prices[s] for s in self.symbols], dtype=float)
+        codes = self.lots["symbol"]
+        return capital_gains(
+            self.lots["buy_price"],
+            prices[codes],
+            self.lots["buy_date"],
+            np.datetime64(current_date, "D"),
+            self.types[codes],
+            self.lots["quantity"],
+        )
+
+    def chains(self, method="fifo"):
+        """Lot positions in the order they may be sold.
+
+        With FIFO a symbol's lots go oldest first, so each symbol is one
+        chain. With specific identification every lot stands alone.
+        """
+        if method == "fifo":
+            return [
+                range(start, end)
+                for start, end in zip(self.offsets[:-1], self.offsets[1:])
+                if end > start
+            ]
+        if method == "specific":
+            return [range(i, i + 1) for i in range(len(self.lots))]
+        raise ValueError(
+            f"Unknown lot method {method!r}, expected one of {LOT_METHODS}"
+        )
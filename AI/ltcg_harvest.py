@@ -0,0 +1,144 @@
+import time
+import heapq
+import argparse
+from math import floor
+
+import numpy as np
+
+# Tax on LTCG above the tax-free limit, used to value a suggestion
+LTCG_TAX_RATE = 0.10
+
+
+def select_units(per_unit, quantities, budget, chains=None):
+    """Whole units to take, largest per-unit amount first, without exceeding budget.
+
+    Returns ([(index, units, amount)], budget left). chains are sequences of
+    indexes that must be sold in order, e.g. a symbol's lots under FIFO:
+    only the head of each chain is on the heap, and the next lot becomes
+    available once the head is sold in full. By default every index stands
+    alone. Lots come off a heap, so only the lots actually used are ordered,
+    and smaller lots keep filling the remainder until not even the smallest
+    per-unit amount fits.
+    """
+
+    def worth_selling(index):
+        return per_unit[index] > 0 and quantities[index] > 0
+
+    if chains is None:
+        heap = [(-per_unit[i], i, 0) for i in range(len(per_unit)) if worth_selling(i)]
+    else:
+        heap = [
+            (-per_unit[chain[0]], number, 0)
+            for number, chain in enumerate(chains)
+            if len(chain) and worth_selling(chain[0])
+        ]
+    if not heap:
+        return [], budget
+    heapq.heapify(heap)
+    smallest = min(amount for amount in per_unit if amount > 0)
+
+    picks = []
+    while heap and budget >= smallest:
+        amount, number, position = heapq.heappop(heap)
+        amount = -amount
+        index = number if chains is None else chains[number][position]
+        units = min(quantities[index], floor(budget / amount))
+        if units > 0:
+            picks.append((index, units, units * amount))
+            budget -= units * amount
+        if (
+            chains is not None
+            and units == quantities[index]
+            and position + 1 < len(chains[number])
+        ):
+            following = chains[number][position + 1]
+            if worth_selling(following):
+                heapq.heappush(heap, (-per_unit[following], number, position + 1))
+    return picks, budget
+
+
+def plan_harvest(gains, quantities, headroom, chains=None):
+    """Long-term stock gains to realize so that realized LTCG reaches the limit.
+
+    gains is gains.capital_gains output and headroom the tax-free LTCG left
+    this year. Selling and buying back these units resets their cost basis
+    tax free.
+    """
+    eligible = gains["is_stock"] & gains["long_term"]
+    per_unit = np.where(eligible, gains["profit_per_unit"], 0.0)
+    return select_units(per_unit.tolist(), list(quantities), headroom, chains)
+
+
+def plan_loss_offset(gains, quantities, excess, chains=None):
+    """Long-term stock losses to book against LTCG above the tax-free limit."""
+    eligible = gains["is_stock"] & gains["long_term"]
+    per_unit = np.where(eligible, -gains["profit_per_unit"], 0.0)
+    return select_units(per_unit.tolist(), list(quantities), excess, chains)
+
+
+def previous_ltcg_scan(profits, long_term):
+    """The former per-asset loop: max() over every LTCG asset seen so far.
+
+    That ran for every asset once realized LTCG was over the limit. Kept only
+    so the benchmark can show the quadratic cost it replaced.
+    """
+    ltcg_assets = []
+    for index, (profit, is_long) in enumerate(zip(profits, long_term)):
+        if is_long and profit > 0:
+            ltcg_assets.append((index, profit))
+        if ltcg_assets:
+            max(ltcg_assets, key=lambda x: x[1])
+
+
+def synthetic_gains(n, seed=0):
+    rng = np.random.default_rng(seed)
+    profit_per_unit = rng.normal(20, 60, n)
+    quantities = rng.integers(1, 500, n)
+    return {
+        "profit_per_unit": profit_per_unit,
+        "profit": profit_per_unit * quantities,
+        "holding_days": rng.integers(1, 2000, n),
+        "long_term": rng.random(n) < 0.7,
+        "is_stock": rng.random(n) < 0.8,
+    }, quantities
+
+
+# The quadratic scan takes minutes beyond this
+PREVIOUS_SCAN_MAX_LOTS = 20000
+
+
+def benchmark(sizes=(10000, 20000, 100000), headroom=100000.0):
+    ok = True
+    for n in sizes:
+        gains, quantities = synthetic_gains(n)
+
+        start = time.perf_counter()
+        picks, left = plan_harvest(gains, quantities, headroom)
+        harvest_time = time.perf_counter() - start
+
+        previous = "skipped"
+        if n <= PREVIOUS_SCAN_MAX_LOTS:
+            start = time.perf_counter()
+            previous_ltcg_scan(gains["profit"].tolist(), gains["long_term"].tolist())
+            previous = f"{(time.perf_counter() - start) * 1000:.1f}ms"
+
+        harvested = sum(amount for _, _, amount in picks)
+        valid = harvested <= headroom + 1e-6 and all(
+            0 < units <= quantities[i] for i, units, _ in picks
+        )
+        ok = ok and valid
+        print(
+            f"{n} lots: heap harvest {harvest_time * 1000:.1f}ms "
+            f"({len(picks)} lots, {harvested:.2f} of {headroom:.0f} filled), "
+            f"previous max() scan {previous}"
+            f"{'' if valid else ', INVALID PLAN'}"
+        )
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LTCG harvest planning.")
+    parser.add_argument("--lots", type=int, nargs="+", default=[10000, 20000, 100000])
+    parser.add_argument("--headroom", type=float, default=100000.0)
+    args = parser.parse_args()
+    raise SystemExit(0 if benchmark(args.lots, args.headroom) else 1)
@@ -0,0 +1,102 @@
+import os
+import time
+import logging
+import threading
+
+# Friendly names accepted by BenchmarkReturns.get, anything else is used as
+# a raw Yahoo Finance ticker
+BENCHMARKS = {
+    "NIFTY50": "^NSEI",
+    "NIFTYBANK": "^NSEBANK",
+    "SENSEX": "^BSESN",
+    "SP500": "^GSPC",
+    "NASDAQ": "^IXIC",
+}
+DEFAULT_BENCHMARK = "NIFTY50"
+# Seconds between reloads of a benchmark series
+BENCHMARK_REFRESH_INTERVAL = float(os.getenv("BENCHMARK_REFRESH_INTERVAL", "21600"))
+
+
+class BenchmarkReturns:
+    """Process-wide cache of benchmark daily returns.
+
+    Each benchmark is loaded once through loader(ticker), which returns a
+    price Series, and reloaded once it is older than refresh_interval. If a
+    reload fails the previous series keeps being served.
+    """
+
+    def __init__(self, loader, refresh_interval=BENCHMARK_REFRESH_INTERVAL):
+        self._loader = loader
+        self.refresh_interval = refresh_interval
+        self._series = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._scheduler = None
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+
+    def _lock_for(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _count(self, stat):
+        # get() runs in to_thread workers, += on a dict entry is not atomic
+        with self._locks_guard:
+            self.stats[stat] += 1
+
+    def get(self, benchmark=DEFAULT_BENCHMARK):
+        ticker = BENCHMARKS.get(benchmark, benchmark)
+        entry = self._series.get(ticker)
+        if entry is not None and time.time() - entry[0] < self.refresh_interval:
+            self._count("hits")
+            return entry[1]
+
+        with self._lock_for(ticker):
+            # Another thread may have loaded it while we waited for the lock
+            entry = self._series.get(ticker)
+            if entry is not None and time.time() - entry[0] < self.refresh_interval:
+                self._count("hits")
+                return entry[1]
+            return self._load(ticker, entry)
+
+    def _load(self, ticker, entry):
+        self._count("misses" if entry is None else "refreshes")
+        try:
+            returns = self._loader(ticker).pct_change().dropna()
+        except Exception as e:
+            self._count("errors")
+            if entry is None:
+                raise
+            logging.error(f"Error refreshing {ticker}, serving cached returns: {e}")
+            return entry[1]
+        self._series[ticker] = (time.time(), returns)
+        return returns
+
+    def aligned(self, returns, benchmark=DEFAULT_BENCHMARK):
+        """Return (asset_returns, benchmark_returns) restricted to common dates."""
+        market_returns = self.get(benchmark)
+        common_dates = returns.index.intersection(market_returns.index)
+        return returns.loc[common_dates], market_returns.loc[common_dates]
+
+    def refresh(self):
+        """Reload every benchmark loaded so far, regardless of age."""
+        for ticker in list(self._series):
+            with self._lock_for(ticker):
+                try:
+                    self._load(ticker, self._series.get(ticker))
+                except Exception as e:
+                    logging.error(f"Error refreshing {ticker}: {e}")
+
+    def start_scheduler(self):
+        """Refresh loaded benchmarks every refresh_interval in a daemon thread."""
+        if self._scheduler is not None or self.refresh_interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.refresh_interval)
+                self.refresh()
+
+        self._scheduler = threading.Thread(
+            target=run, name="benchmark-refresh", daemon=True
+        )
+        self._scheduler.start()
@@ -0,0 +1,221 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+
+from price_cache import PriceCache, period_start
+from singleflight import ThreadSingleFlight
+
+COMMODITY_MAP = {
+    "GOLD": "GC=F",
+    "SILVER": "SI=F",
+    "CRUDEOIL": "CL=F",
+    "REALESTATE": "NIFTYTV23REALT.NS",
+}
+
+
+def resolve_symbol(symbol, asset_type):
+    """Map a portfolio symbol to (source, upstream symbol)."""
+    if asset_type in ["stock", "etf", "mutual_fund", "index"]:
+        if not symbol.endswith(".NS") and asset_type == "stock":
+            symbol += ".NS"
+        return "yfinance", symbol
+    elif asset_type == "crypto":
+        return "coingecko", symbol.lower()
+    elif asset_type in ["commodity", "real_estate"]:
+        return "yfinance", COMMODITY_MAP.get(symbol.upper(), symbol)
+    raise ValueError(f"Unsupported asset type: {asset_type}")
+
+
+class YahooFetcher:
+    """Downloads any number of tickers with a single yf.download call."""
+
+    def download(self, symbols, start):
+        import yfinance as yf
+
+        data = yf.download(symbols, start=start, group_by="ticker")
+        if not isinstance(data.columns, pd.MultiIndex):
+            return {symbols[0]: data}
+        frames = {}
+        for symbol in symbols:
+            if symbol in data.columns.get_level_values(0):
+                frames[symbol] = data[symbol].dropna(how="all")
+        return frames
+
+
+class CoinGeckoFetcher:
+    """Downloads CoinGecko price history over one pooled HTTP session.
+
+    The free API has no multi-coin history endpoint, so coins are still
+    requested one by one, but they share a keep-alive connection.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def download(self, coin_ids, start):
+        # 1 year max (free tier limitation)
+        start = max(start, datetime.now() - timedelta(days=365))
+        end_date = datetime.now()
+        frames = {}
+        for coin_id in coin_ids:
+            url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart/range"
+            params = {
+                "vs_currency": "inr",
+                "from": int(start.timestamp()),
+                "to": int(end_date.timestamp()),
+            }
+            response = self.session.get(url, params=params)
+            if response.status_code != 200:
+                logging.error(
+                    f"CoinGecko API error: {response.status_code} - {response.text}"
+                )
+                continue
+            json_data = response.json()
+            df = pd.DataFrame(json_data["prices"], columns=["Date", "Close"])
+            df["Date"] = pd.to_datetime(df["Date"], unit="ms")
+            df.set_index("Date", inplace=True)
+            df["Volume"] = [item[1] for item in json_data["total_volumes"]]
+            # Short ranges come back hourly, keep one bar per day so refreshes
+            # line up with the daily series already in the cache
+            frames[coin_id] = df.groupby(df.index.normalize()).last()
+        return frames
+
+
+class FixtureFetcher:
+    """Serves recorded frames from <directory>/<source>/<symbol>.csv.
+
+    Lets fetch_bulk run offline, e.g. against frames saved by RecordingFetcher.
+    """
+
+    def __init__(self, directory, source):
+        self.directory = os.path.join(directory, source)
+
+    def download(self, symbols, start):
+        frames = {}
+        for symbol in symbols:
+            path = os.path.join(self.directory, f"{symbol}.csv")
+            if os.path.exists(path):
+                data = pd.read_csv(path, index_col=0, parse_dates=True)
+                frames[symbol] = data[data.index >= pd.Timestamp(start)]
+        return frames
+
+
+class RecordingFetcher:
+    """Wraps a fetcher and saves everything it returns as FixtureFetcher files."""
+
+    def __init__(self, fetcher, directory, source):
+        self.fetcher = fetcher
+        self.directory = os.path.join(directory, source)
+
+    def download(self, symbols, start):
+        frames = self.fetcher.download(symbols, start)
+        os.makedirs(self.directory, exist_ok=True)
+        for symbol, data in frames.items():
+            data.to_csv(os.path.join(self.directory, f"{symbol}.csv"))
+        return frames
+
+
+default_fetchers = {"yfinance": YahooFetcher(), "coingecko": CoinGeckoFetcher()}
+price_cache = PriceCache()
+# Symbols being fetched for one request are waited for by the others
+price_flight = ThreadSingleFlight("market_data")
+
+
+def fetch_bulk(items, period="1y", fetchers=None, cache=price_cache):
+    """Fetch price history for every item with one download per source.
+
+    items are dicts with "symbol" and "type" keys, as returned by
+    rebalance_portfolio. Returns {(symbol, type): DataFrame or None}, each
+    frame shaped like fetch_data's output. Series still fresh in the price
+    cache are not downloaded again, and series another thread is already
+    fetching with the default fetchers and cache are shared with it.
+    """
+    if fetchers is not None or cache is not price_cache:
+        return _fetch_bulk(items, period, fetchers, cache)
+
+    by_key = {(item["symbol"], item["type"]): item for item in items}
+
+    def fetch(keys):
+        frames = _fetch_bulk(
+            [by_key[symbol, asset_type] for _, symbol, asset_type in keys], period
+        )
+        return {(period, *key): frame for key, frame in frames.items()}
+
+    shared = price_flight.do_many([(period, *key) for key in by_key], fetch)
+    return {key[1:]: frame for key, frame in shared.items()}
+
+
+def _fetch_bulk(items, period="1y", fetchers=None, cache=price_cache):
+    fetchers = fetchers or default_fetchers
+    start = period_start(period)
+    results = {}
+    resolved = {}
+    # source -> {upstream symbol: [(asset_type, since, series start, status)]}
+    pending = {}
+
+    for item in items:
+        key = (item["symbol"], item["type"])
+        if key in resolved or key in results:
+            continue
+        try:
+            source, symbol = resolve_symbol(*key)
+        except ValueError as e:
+            logging.error(f"Error fetching data for {key[0]}: {str(e)}")
+            results[key] = None
+            continue
+        resolved[key] = (symbol, key[1])
+        if cache is None:
+            pending.setdefault(source, {}).setdefault(symbol, []).append(
+                (key[1], start, None, "miss")
+            )
+            continue
+        status, since, series_start = cache.plan(symbol, key[1], start)
+        if status != "hit":
+            pending.setdefault(source, {}).setdefault(symbol, []).append(
+                (key[1], since, series_start, status)
+            )
+
+    downloaded = {}
+    for source, symbols in pending.items():
+        since = min(plan[1] for plans in symbols.values() for plan in plans)
+        try:
+            frames = fetchers[source].download(list(symbols), since)
+        except Exception as e:
+            logging.error(f"Error downloading {list(symbols)} from {source}: {e}")
+            frames = {}
+        for symbol, plans in symbols.items():
+            data = frames.get(symbol)
+            for asset_type, _, series_start, status in plans:
+                if cache is None:
+                    downloaded[(symbol, asset_type)] = data
+                elif data is not None and not data.empty:
+                    cache.store(
+                        symbol,
+                        asset_type,
+                        data,
+                        series_start,
+                        replace=status == "miss",
+                    )
+                elif status == "refresh":
+                    logging.warning(f"Refresh failed for {symbol}, serving cached bars")
+    if cache is not None and pending:
+        cache.evict()
+
+    for key, (symbol, asset_type) in resolved.items():
+        if cache is None:
+            data = downloaded.get((symbol, asset_type))
+        else:
+            data = cache.read(symbol, asset_type, int(pd.Timestamp(start).timestamp()))
+        if data is None or data.empty:
+            logging.error(
+                f"Error fetching data for {symbol}: No data available for {symbol}"
+            )
+            results[key] = None
+            continue
+        results[key] = data.dropna().interpolate(method="time")
+        logging.info(f"Data fetched for {symbol}")
+
+    return results
@@ -1,120 +1,115 @@
 import pandas as pd
-from bs4 import BeautifulSoup
 from urllib.request import urlopen, Request
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import nltk
 import logging
 from datetime import datetime, timedelta
-from groq import Groq
 import json
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List
 import requests
 import os
 from dotenv import load_dotenv
 import logging
-import aiohttp
+import asyncio
+from http_client import http_client
+from html_parse import (
+    ARTICLE_MAX_BYTES,
+    FINVIZ_MAX_BYTES,
+    NewsTableParser,
+    ParagraphParser,
+)
+from llm_gateway import llm_gateway, LLM_MODEL
+from llm_cache import llm_cache
+from sentiment import sentiment_engine
+from news_store import news_store
+from singleflight import SingleFlight
 
 # Load environment variables
 load_dotenv()
 
+FINVIZ_URL = "https://finviz.com/quote.ashx?t="
+# Seconds /getNews/ may spend before returning the summaries that are ready
+NEWS_DEADLINE = float(os.getenv("NEWS_DEADLINE", "30"))
+# LLM summaries in flight at once per request
+SUMMARY_CONCURRENCY = int(os.getenv("NEWS_SUMMARY_CONCURRENCY", "4"))
+# Seconds between background passes over stale tickers, 0 disables them
+NEWS_REFRESH_TICK = float(os.getenv("NEWS_REFRESH_TICK", "60"))
+ARTICLE_SUMMARY_PROMPT = ". Provide a 2-3 line summary of this article. dont write amything else. not even here is the information you requested."
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
-try:
-    nltk.download("vader_lexicon")
-except Exception as e:
-    logging.error(f"Error downloading vader_lexicon: {e}")
 app = FastAPI()
 
+# Concurrent requests for the same ticker, article or summary share one call
+finviz_flight = SingleFlight("finviz")
+article_flight = SingleFlight("articles")
+summary_flight = SingleFlight("article_summaries")
+
 
 class Portfolio(BaseModel):
     portfolio_json: List[str]
 
 
+class SentimentWindow(BaseModel):
+    portfolio_json: List[str]
+    days: int = Field(7, ge=1, le=365)
+
+
 # Function to get sentiment using VADER model
 def get_sentiment_vader(news):
-    analyzer = SentimentIntensityAnalyzer()
-    scores = news["Headline"].apply(analyzer.polarity_scores).tolist()
-    df_scores = pd.DataFrame(scores)
-    news = news.join(df_scores, rsuffix="_right")
+    return sentiment_engine.ticker_sentiment(news)
 
-    # Normalize compound score to range [0, 1]
-    news["normalized_score"] = (1 - news["compound"]) / 2
 
-    # View Data
-    news["Date"] = pd.to_datetime(news.Date).dt.date
+def parse_news_table(ticker, news_table):
+    parsed_news = []
+    for date_text, headline, link in news_table:
+        date_scrape = date_text.split()
 
-    unique_ticker = news["Ticker"].unique().tolist()
-    news_dict = {name: news.loc[news["Ticker"] == name] for name in unique_ticker}
+        if len(date_scrape) == 1:
+            time = date_scrape[0]
+            date = datetime.now().date()
+        else:
+            date = date_scrape[0]
+            time = date_scrape[1]
 
-    # Calculate current sentiment for each ticker and print headlines
-    current_sentiments = {}
-    for ticker in unique_ticker:
-        dataframe = news_dict[ticker]
-        dataframe = dataframe.set_index("Ticker")
-        dataframe = dataframe.sort_values(by=["Date", "Time"], ascending=False)
-        most_recent_date = dataframe["Date"].max()
-        recent_data = dataframe[dataframe["Date"] == most_recent_date]
-        current_sentiment = recent_data["normalized_score"].mean()
-        current_sentiments[ticker] = current_sentiment
+        if date == "Today":
+            date = datetime.now().date()
+        elif date == "Yesterday":
+            date = datetime.now().date() - timedelta(1)
+        else:
+            date = pd.to_datetime(date).date()
 
-        # Print current sentiment and headlines
-        print(f"Current sentiment for {ticker}: {current_sentiment:.2f}")
-        print("Recent headlines:")
-        for headline in recent_data["Headline"]:
-            print(f"- {headline}")
-        print("\n")
+        parsed_news.append([ticker, date, time, headline, link])
+    return parsed_news
 
-    return current_sentiments
 
+# Asynchronous function to fetch the top finviz headlines of one ticker
+async def fetch_ticker_news(ticker):
+    return await finviz_flight.do(ticker, _fetch_ticker_news, ticker)
 
-# Asynchronous function to fetch news data
-async def fetch_news_data(tickers):
-    finwiz_url = "https://finviz.com/quote.ashx?t="
-    news_tables = {}
-
-    async with aiohttp.ClientSession() as session:
-        for ticker in tickers:
-            url = finwiz_url + ticker
-            try:
-                async with session.get(
-                    url,
-                    headers={
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-                    },
-                ) as resp:
-                    html = BeautifulSoup(await resp.text(), features="lxml")
-                    news_table = html.find(id="news-table")
-                    news_tables[ticker] = news_table
-            except Exception as e:
-                logging.error(f"Error fetching data for {ticker}: {e}")
 
-    parsed_news = []
+async def _fetch_ticker_news(ticker):
+    url = FINVIZ_URL + ticker
+    try:
+        # Only the top 5 articles, the page is not read past them
+        news_table = await http_client.get_parsed(
+            url,
+            lambda charset: NewsTableParser(limit=5, encoding=charset),
+            FINVIZ_MAX_BYTES,
+        )
+        return parse_news_table(ticker, news_table)
+    except Exception as e:
+        logging.error(f"Error fetching data for {ticker}: {e}")
+        return []
 
-    for file_name, news_table in news_tables.items():
-        for row in news_table.findAll("tr")[:5]:  # Only take the top 5 articles
-            headline = row.a.get_text()
-            link = row.a["href"]
-            date_scrape = row.td.text.split()
-
-            if len(date_scrape) == 1:
-                time = date_scrape[0]
-                date = datetime.now().date()
-            else:
-                date = date_scrape[0]
-                time = date_scrape[1]
-
-            if date == "Today":
-                date = datetime.now().date()
-            elif date == "Yesterday":
-                date = datetime.now().date() - timedelta(1)
-            else:
-                date = pd.to_datetime(date).date()
-
-            ticker = file_name.split("_")[0]
-            parsed_news.append([ticker, date, time, headline, link])
+
+# Asynchronous function to fetch news data
+async def fetch_news_data(tickers):
+    # All pages are requested together, finviz concurrency is capped by
+    # the shared HTTP client
+    results = await asyncio.gather(*(fetch_ticker_news(t) for t in tickers))
+    parsed_news = [row for rows in results for row in rows]
 
     columns = ["Ticker", "Date", "Time", "Headline", "Link"]
     news = pd.DataFrame(parsed_news, columns=columns)
@@ -123,87 +118,149 @@ async def fetch_news_data(tickers):
 
 # Asynchronous function to get summary using LLaMA model
 async def get_summary_llama(prompt=""):
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        logging.error("GROQ_API_KEY is not set in the environment variables.")
-        return None
-
-    # Debugging: Print the API key
-    logging.info(f"Using GROQ_API_KEY: {api_key}")
+    # The same article is often summarized for several users
+    cache_key = llm_cache.key(LLM_MODEL, ARTICLE_SUMMARY_PROMPT, prompt)
+    cached = await asyncio.to_thread(llm_cache.get, cache_key)
+    if cached is not None:
+        return cached
+    return await summary_flight.do(cache_key, _summarize_article, cache_key, prompt)
 
-    client = Groq(api_key=api_key)
-    try:
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                    + ". Provide a 2-3 line summary of this article. dont write amything else. not even here is the information you requested.",
-                }
-            ],
-            temperature=1,
-            max_tokens=8192,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
 
-        # Extract the response content
-        response_content = completion.choices[0].message.content
-
-        return response_content.strip()
-
-    except Exception as e:
-        logging.error(f"An error occurred: {e}")
+async def _summarize_article(cache_key, prompt):
+    response_content = await llm_gateway.complete(prompt + ARTICLE_SUMMARY_PROMPT)
+    if response_content is None:
         return None
+    summary = response_content.strip()
+    await asyncio.to_thread(llm_cache.set, cache_key, summary)
+    return summary
 
 
 # Asynchronous function to fetch article content
 async def fetch_article_content(url):
+    return await article_flight.do(url, _fetch_article_content, url)
+
+
+async def _fetch_article_content(url):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-                },
-            ) as resp:
-                html = BeautifulSoup(await resp.text(), features="lxml")
-                paragraphs = html.find_all("p")
-                content = " ".join([para.get_text() for para in paragraphs])
-                return content
+        return await http_client.get_parsed(
+            url, lambda charset: ParagraphParser(encoding=charset), ARTICLE_MAX_BYTES
+        )
     except Exception as e:
         logging.error(f"Error fetching article content from {url}: {e}")
         return None
 
 
-async def generate_financial_news(tickers):
-    """Generate financial news for a given symbol using LLAMA API."""
-    output = {}
+async def generate_financial_news(tickers, deadline=NEWS_DEADLINE):
+    """Generate financial news for a given symbol using LLAMA API.
 
-    for ticker in tickers:
-        news = await fetch_news_data([ticker])
-        articles = []
-        for index, row in news.iterrows():
-            if index >= 2:  # limit to 2
-                break
-            article_content = await fetch_article_content(row["Link"])
-            if article_content:
+    Every ticker page and article is fetched concurrently and summaries run
+    behind a semaphore. Once deadline seconds pass, whatever has been
+    summarized is returned and the remaining work is cancelled. Fetches and
+    summaries shared with another request through a SingleFlight keep
+    running for that request, and stop once no request waits on them.
+    """
+    summary_limit = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    articles = {}
+
+    async def summarize(ticker, index, row):
+        article_content = await fetch_article_content(row[4])
+        if article_content:
+            async with summary_limit:
                 summary = await get_summary_llama(article_content)
-                if summary:
-                    article = {
-                        "headline": row["Headline"],
-                        "author": "Unknown",
-                        "site": row["Link"],
-                        "summary": summary,
-                    }
-                    articles.append(article)
-        output[ticker] = articles
+            if summary:
+                articles[(ticker, index)] = {
+                    "headline": row[3],
+                    "author": "Unknown",
+                    "site": row[4],
+                    "summary": summary,
+                }
+
+    async def ticker_news(ticker):
+        rows = (await fetch_ticker_news(ticker))[:2]  # limit to 2
+        await asyncio.gather(
+            *(summarize(ticker, index, row) for index, row in enumerate(rows))
+        )
+
+    tickers = list(dict.fromkeys(tickers))
+    tasks = [asyncio.create_task(ticker_news(ticker)) for ticker in tickers]
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(
+                f"News deadline of {deadline}s hit, {len(pending)} tickers incomplete"
+            )
+        for task in done:
+            if task.exception() is not None:
+                logging.error(f"Error generating news: {task.exception()}")
+
+    output = {}
+    for ticker in tickers:
+        output[ticker] = [
+            articles[(ticker, index)]
+            for index in range(2)
+            if (ticker, index) in articles
+        ]
 
     return json.dumps(output, indent=4)
 
 
+_refreshing = {}
+
+
+async def scrape_into_store(tickers):
+    results = await asyncio.gather(*(fetch_ticker_news(t) for t in tickers))
+    for ticker, rows in zip(tickers, results):
+        known = await asyncio.to_thread(
+            news_store.known_links, ticker, [row[4] for row in rows]
+        )
+        rows = [row for row in rows if row[4] not in known]
+        if rows:
+            scores = await asyncio.to_thread(
+                sentiment_engine.score, [row[3] for row in rows]
+            )
+            await asyncio.to_thread(news_store.append, rows, scores)
+    await asyncio.to_thread(news_store.mark_refreshed, tickers)
+
+
+async def refresh_news(tickers):
+    """Scrape tickers and append the headlines not yet in the store.
+
+    Tickers already being scraped by another caller are awaited rather than
+    scraped twice.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    new = [t for t in tickers if t not in _refreshing]
+    if new:
+        task = asyncio.create_task(scrape_into_store(new))
+        for ticker in new:
+            _refreshing[ticker] = task
+
+        def done(_):
+            for ticker in new:
+                if _refreshing.get(ticker) is task:
+                    del _refreshing[ticker]
+
+        task.add_done_callback(done)
+    tasks = {_refreshing[t] for t in tickers if t in _refreshing}
+    # shield: a caller giving up must not cancel a scrape others wait on
+    await asyncio.gather(*(asyncio.shield(task) for task in tasks))
+
+
+async def refresh_stale_news():
+    """Keep recently requested tickers fresh so requests read from the store."""
+    while True:
+        await asyncio.sleep(NEWS_REFRESH_TICK)
+        try:
+            due = await asyncio.to_thread(news_store.due)
+            if due:
+                await refresh_news(due)
+            await asyncio.to_thread(news_store.prune)
+        except Exception as e:
+            logging.error(f"Error refreshing news: {e}")
+
+
 async def test():
     tickers = ["TCS", "RELI"]
     news = await fetch_news_data(tickers)
@@ -218,6 +275,24 @@ async def test():
     print("Top Articles JSON:", output)
 
 
+_refresher = None
+_background = set()
+
+
+@app.on_event("startup")
+async def start_news_refresher():
+    global _refresher
+    if NEWS_REFRESH_TICK > 0:
+        _refresher = asyncio.create_task(refresh_stale_news())
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    if _refresher is not None:
+        _refresher.cancel()
+    await http_client.close()
+
+
 @app.post("/getNews/")
 async def get_news(portfolio: Portfolio):
     """Receive portfolio (tickers) and return generated news summaries."""
@@ -226,13 +301,37 @@ async def get_news(portfolio: Portfolio):
 
 @app.post("/getSentiment/")
 async def get_sentiment(portfolio: Portfolio):
-    """Receive portfolio (tickers) and return sentiment analysis."""
-    news = await fetch_news_data(portfolio.portfolio_json)
-    return get_sentiment_vader(news)
+    """Receive portfolio (tickers) and return sentiment analysis.
+
+    Served from the headline store. Only tickers never seen before are
+    scraped on the request path, stale ones are refreshed in the background.
+    """
+    tickers = await load_tickers(portfolio.portfolio_json)
+    return await asyncio.to_thread(news_store.latest_sentiment, tickers)
+
+
+@app.post("/getSentiment/rolling/")
+async def get_rolling_sentiment(window: SentimentWindow):
+    """Daily and overall mean sentiment of each ticker over the last days days."""
+    tickers = await load_tickers(window.portfolio_json)
+    return await asyncio.to_thread(news_store.rolling_sentiment, tickers, window.days)
+
+
+async def load_tickers(tickers):
+    tickers = list(dict.fromkeys(tickers))
+    missing, stale = await asyncio.to_thread(news_store.touch, tickers)
+    if missing:
+        await refresh_news(missing)
+    if stale:
+        task = asyncio.create_task(refresh_news(stale))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+    return tickers
 
 
 if __name__ == "__main__":
     import uvicorn
+
     # import asyncio
 
     # # Run the test
@@ -0,0 +1,218 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+from config import CACHE_DIR
+
+# Seconds after which a ticker's headlines are scraped again
+NEWS_MAX_AGE = float(os.getenv("NEWS_MAX_AGE", "900"))
+# Tickers requested within this many seconds are kept fresh by the refresher
+NEWS_TRACK_SECONDS = float(os.getenv("NEWS_TRACK_SECONDS", str(7 * 86400)))
+# Days of headlines kept before they are deleted
+NEWS_RETENTION_DAYS = int(os.getenv("NEWS_RETENTION_DAYS", "180"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS headlines (
+    ticker TEXT NOT NULL,
+    link TEXT NOT NULL,
+    published_at REAL NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT,
+    headline TEXT NOT NULL,
+    score REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (ticker, link)
+);
+CREATE INDEX IF NOT EXISTS headlines_ticker_date ON headlines (ticker, date);
+CREATE TABLE IF NOT EXISTS tickers (
+    ticker TEXT PRIMARY KEY,
+    refreshed_at REAL,
+    requested_at REAL
+);
+"""
+
+
+def published_at(day, clock):
+    """Epoch seconds of a finviz date and "09:30AM" style time, midnight if unparsable."""
+    day = day if isinstance(day, date) else datetime.fromisoformat(str(day)).date()
+    try:
+        moment = datetime.strptime(clock.strip().upper(), "%I:%M%p").time()
+    except (AttributeError, ValueError):
+        moment = datetime.min.time()
+    return datetime.combine(day, moment).timestamp()
+
+
+class HeadlineStore:
+    """Append-only store of scored finviz headlines, one row per (ticker, link).
+
+    Rows are never updated once written, so a headline keeps the score it
+    was first given. The tickers table records when each ticker was last
+    scraped and last requested, which is what the background refresher uses
+    to pick the tickers to update.
+    """
+
+    def __init__(self, path=None, max_age=NEWS_MAX_AGE):
+        self.path = path or os.path.join(CACHE_DIR, "news.sqlite")
+        self.max_age = max_age
+        self.stats = {"appended": 0, "duplicates": 0, "refreshes": 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def known_links(self, ticker, links):
+        """The subset of links already stored for ticker."""
+        links = list(links)
+        if not links:
+            return set()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT link FROM headlines WHERE ticker = ? AND link IN "
+                f"({', '.join('?' * len(links))})",
+                (ticker, *links),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def append(self, rows, scores):
+        """Store parse_news_table rows with their scores, skipping known links.
+
+        Returns the number of new headlines.
+        """
+        now = time.time()
+        records = [
+            (
+                ticker,
+                link,
+                published_at(day, clock),
+                str(day),
+                clock,
+                headline,
+                float(score),
+                now,
+            )
+            for (ticker, day, clock, headline, link), score in zip(rows, scores)
+        ]
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO headlines VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            added = conn.total_changes - before
+        with self._stats_lock:
+            self.stats["appended"] += added
+            self.stats["duplicates"] += len(records) - added
+        return added
+
+    def mark_refreshed(self, tickers):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO tickers (ticker, refreshed_at) VALUES (?, ?) "
+                "ON CONFLICT (ticker) DO UPDATE SET refreshed_at = excluded.refreshed_at",
+                [(ticker, now) for ticker in tickers],
+            )
+        with self._stats_lock:
+            self.stats["refreshes"] += len(tickers)
+
+    def touch(self, tickers):
+        """Record a request for tickers; return those never scraped and those stale."""
+        if not tickers:
+            return [], []
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO tickers (ticker, requested_at) VALUES (?, ?) "
+                "ON CONFLICT (ticker) DO UPDATE SET requested_at = excluded.requested_at",
+                [(ticker, now) for ticker in tickers],
+            )
+            refreshed = dict(
+                conn.execute(
+                    "SELECT ticker, refreshed_at FROM tickers WHERE ticker IN "
+                    f"({', '.join('?' * len(tickers))})",
+                    tuple(tickers),
+                ).fetchall()
+            )
+        missing = [t for t in tickers if refreshed.get(t) is None]
+        stale = [
+            t
+            for t in tickers
+            if refreshed.get(t) is not None and now - refreshed[t] >= self.max_age
+        ]
+        return missing, stale
+
+    def due(self, track_seconds=NEWS_TRACK_SECONDS):
+        """Recently requested tickers whose headlines are older than max_age."""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT ticker FROM tickers WHERE requested_at >= ? "
+                "AND (refreshed_at IS NULL OR refreshed_at < ?) ORDER BY refreshed_at",
+                (now - track_seconds, now - self.max_age),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def latest_sentiment(self, tickers):
+        """Mean score of each ticker's headlines on its most recent date."""
+        if not tickers:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT h.ticker, AVG(h.score) FROM headlines h JOIN ("
+                "SELECT ticker, MAX(date) AS date FROM headlines WHERE ticker IN "
+                f"({', '.join('?' * len(tickers))}) GROUP BY ticker"
+                ") latest ON h.ticker = latest.ticker AND h.date = latest.date "
+                "GROUP BY h.ticker",
+                tuple(tickers),
+            ).fetchall()
+        means = dict(rows)
+        return {ticker: means[ticker] for ticker in tickers if ticker in means}
+
+    def rolling_sentiment(self, tickers, days, today=None):
+        """Daily and window mean scores of each ticker over the last days days."""
+        today = today or datetime.now().date()
+        start = str(today - timedelta(days=days - 1))
+        if not tickers:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT ticker, date, AVG(score), COUNT(*) FROM headlines "
+                f"WHERE ticker IN ({', '.join('?' * len(tickers))}) AND date >= ? "
+                "GROUP BY ticker, date ORDER BY ticker, date",
+                (*tickers, start),
+            ).fetchall()
+
+        windows = {}
+        for ticker, day, mean, count in rows:
+            window = windows.setdefault(ticker, {"daily": [], "headlines": 0})
+            window["daily"].append({"date": day, "score": mean, "headlines": count})
+            window["headlines"] += count
+        for window in windows.values():
+            window["score"] = (
+                sum(d["score"] * d["headlines"] for d in window["daily"])
+                / window["headlines"]
+            )
+        return {ticker: windows[ticker] for ticker in tickers if ticker in windows}
+
+    def prune(self, retention_days=NEWS_RETENTION_DAYS):
+        cutoff = str(datetime.now().date() - timedelta(days=retention_days))
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM headlines WHERE date < ?", (cutoff,)
+            ).rowcount
+
+
+news_store = HeadlineStore()
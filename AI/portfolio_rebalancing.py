@@ -1,18 +1,27 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-import pandas as pd
 import numpy as np
-import yfinance as yf
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
 import logging
-from datetime import datetime, timedelta
-import requests
-from bs4 import BeautifulSoup
-from textblob import TextBlob
 import re
 import json
+import os
+import asyncio
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from market_data import fetch_bulk
+from risk_models import (
+    MIN_TRAINING_ROWS,
+    RiskModelRegistry,
+    build_features,
+    model_key,
+)
+from market_benchmark import BenchmarkReturns, DEFAULT_BENCHMARK
+from rss_feed import rss_feed
+from lots import LotColumns, LotStore
+from rebalance_state import rebalance_state
+from prewarm import PREWARM_INTERVAL, market_signals, prewarmer
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -20,6 +29,21 @@ logging.basicConfig(
 
 app = FastAPI()
 
+# "concurrent" runs the per-asset pipeline off the event loop, "sequential"
+# keeps the original one-item-at-a-time behaviour
+SUGGEST_MODE = os.getenv("REBALANCE_MODE", "concurrent")
+# Max simultaneous downloads / news fetches per request
+IO_CONCURRENCY = int(os.getenv("REBALANCE_IO_CONCURRENCY", "8"))
+# Worker processes for model training, 0 trains in a thread instead
+CPU_WORKERS = int(os.getenv("REBALANCE_CPU_WORKERS", str(os.cpu_count() or 1)))
+
+# Article texts whose TextBlob polarity is kept in memory
+POLARITY_MEMO_SIZE = int(os.getenv("POLARITY_MEMO_SIZE", "20000"))
+
+_process_pool = None
+
+model_registry = RiskModelRegistry()
+
 # Add ticker to company name mapping
 ticker_to_company = {
     "RELIANCE.NS": "Reliance Industries",
@@ -43,8 +67,14 @@ class PortfolioItem(BaseModel):
 
 
 class Portfolio(BaseModel):
-    items: List[PortfolioItem]
+    items: List[PortfolioItem] = []
+    # Holdings as tax lots, summed per symbol and added to items
+    lots: Optional[LotColumns] = None
     risk_factor: float
+    # With a user_id, incremental runs reuse the user's unexpired per-asset
+    # signals from the previous run and only compute the rest
+    user_id: Optional[str] = None
+    incremental: bool = False
 
 
 class SuggestedItem(BaseModel):
@@ -59,74 +89,42 @@ class RebalancedPortfolio(BaseModel):
 
 
 def fetch_data(symbol, period="1y", asset_type="stock"):
-    try:
-        if asset_type in ["stock", "etf", "mutual_fund"]:
-            if not symbol.endswith(".NS") and asset_type == "stock":
-                symbol += ".NS"
-            data = yf.download(symbol, period=period)
-        elif asset_type == "crypto":
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=365)  # 1 year (free tier limitation)
-            url = f"https://api.coingecko.com/api/v3/coins/{symbol.lower()}/market_chart/range"
-            params = {
-                "vs_currency": "inr",
-                "from": int(start_date.timestamp()),
-                "to": int(end_date.timestamp()),
-            }
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                json_data = response.json()
-                df = pd.DataFrame(json_data["prices"], columns=["Date", "Close"])
-                df["Date"] = pd.to_datetime(df["Date"], unit="ms")
-                df.set_index("Date", inplace=True)
-                df["Volume"] = [item[1] for item in json_data["total_volumes"]]
-                data = df
-            else:
-                logging.error(
-                    f"CoinGecko API error: {response.status_code} - {response.text}"
-                )
-                raise ValueError(f"Unable to fetch data for {symbol}")
-        elif asset_type in ["commodity", "real_estate"]:
-            commodity_map = {
-                "GOLD": "GC=F",
-                "SILVER": "SI=F",
-                "CRUDEOIL": "CL=F",
-                "REALESTATE": "NIFTYTV23REALT.NS",
-            }
-            symbol = commodity_map.get(symbol.upper(), symbol)
-            data = yf.download(symbol, period=period)
-        else:
-            raise ValueError(f"Unsupported asset type: {asset_type}")
+    items = [{"symbol": symbol, "type": asset_type}]
+    return fetch_bulk(items, period=period)[(symbol, asset_type)]
+
+
+def load_benchmark(ticker, period="2y"):
+    data = fetch_data(ticker, period=period, asset_type="index")
+    if data is None:
+        raise ValueError(f"Unable to fetch benchmark {ticker}")
+    return data["Adj Close"] if "Adj Close" in data.columns else data["Close"]
 
-        if data.empty:
-            raise ValueError(f"No data available for {symbol}")
-        data = data.dropna().interpolate(method="time")
-        logging.info(f"Data fetched for {symbol}")
-        return data
-    except Exception as e:
-        logging.error(f"Error fetching data for {symbol}: {str(e)}")
-        return None
 
+# Loaded once per process and shared by every beta calculation
+benchmark_returns = BenchmarkReturns(load_benchmark)
 
-def calculate_risk_metrics(data):
+
+def calculate_risk_metrics(data, benchmark=DEFAULT_BENCHMARK):
     if data is None or data.empty:
         return None
 
     returns = data["Close"].pct_change().dropna()
     volatility = returns.std() * np.sqrt(252)
-    beta = calculate_beta(returns)
+    try:
+        stock_returns, market_returns = benchmark_returns.aligned(returns, benchmark)
+        beta = calculate_beta(stock_returns, market_returns)
+    except Exception as e:
+        logging.error(f"Error fetching market data: {e}")
+        beta = None
     sharpe_ratio = calculate_sharpe_ratio(returns)
 
     return {"volatility": volatility, "beta": beta, "sharpe_ratio": sharpe_ratio}
 
 
-def calculate_beta(returns, market_returns=None):
+def calculate_beta(returns, market_returns=None, benchmark=DEFAULT_BENCHMARK):
     if market_returns is None:
         try:
-            market_data = yf.download(
-                "^NSEI", start=returns.index[0], end=returns.index[-1]
-            )
-            market_returns = market_data["Adj Close"].pct_change().dropna()
+            market_returns = benchmark_returns.get(benchmark)
         except Exception as e:
             logging.error(f"Error fetching market data: {e}")
             return None
@@ -153,55 +151,19 @@ def predict_risk(symbol, data, asset_type):
     if data is None or data.empty:
         return None
 
-    # Calculate various features
-    returns = data["Close"].pct_change().dropna()
-    log_returns = np.log(1 + returns)
-    volatility = returns.rolling(window=30).std() * np.sqrt(252)
-    ma_50 = data["Close"].rolling(window=50).mean()
-    ma_200 = data["Close"].rolling(window=200).mean()
-
-    # Prepare features for the model
-    features = pd.DataFrame(
-        {
-            "log_returns": log_returns,
-            "volatility": volatility,
-            "ma_50": ma_50,
-            "ma_200": ma_200,
-            "volume": data["Volume"],
-        }
-    ).dropna()
-
-    # Prepare target (future volatility)
-    future_volatility = volatility.shift(-30).dropna()
-
-    # Align features and target
-    features = features[:-30]
-    future_volatility = future_volatility[: len(features)]
+    features, future_volatility = build_features(data)
 
     # If we don't have enough data points, return a high risk value
-    if len(features) < 100:  # Arbitrary threshold, adjust as needed
+    if len(features) < MIN_TRAINING_ROWS:
         logging.warning(
             f"Not enough data points for {symbol} to predict risk accurately. Returning high risk."
         )
         return 0.5  # Arbitrary high risk value, adjust as needed
 
-    # Split data
-    train_size = int(len(features) * 0.8)
-    X_train, X_test = features[:train_size], features[train_size:]
-    y_train, y_test = future_volatility[:train_size], future_volatility[train_size:]
-
-    # Scale features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-
-    # Train model
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train_scaled, y_train)
-
-    # Predict risk (use the last available data point)
-    last_data_point = scaler.transform(features.iloc[-1].values.reshape(1, -1))
-    predicted_risk = model.predict(last_data_point)[0]
+    # Reuses the stored model unless enough new bars arrived since it was fit
+    predicted_risk = model_registry.predict(
+        model_key(symbol, asset_type), features, future_volatility
+    )
 
     # Adjust risk based on asset type
     if asset_type == "options":
@@ -221,62 +183,45 @@ def predict_risk(symbol, data, asset_type):
 
 
 def fetch_news(query, num_articles=5):
-    url = f"https://news.google.com/rss/search?q={query}&hl=en-IN&gl=IN&ceid=IN:en"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, features="xml")
-    articles = soup.findAll("item")
-
-    news_list = []
-    for a in articles[:num_articles]:
-        title = a.title.text
-        link = a.link.text
-        pub_date = a.pubDate.text
-        description = a.description.text
-        news_list.append(
-            {
-                "title": title,
-                "link": link,
-                "pub_date": pub_date,
-                "description": description,
-            }
-        )
-
-    print("Stage 2")
-    print(news_list)
-    return news_list
+    return rss_feed.fetch_blocking(query, num_articles)
 
 
+# The same articles come back for every request until the feed refreshes
+@lru_cache(maxsize=POLARITY_MEMO_SIZE)
 def analyze_sentiment(text):
+    from textblob import TextBlob
+
     blob = TextBlob(text)
     return blob.sentiment.polarity
 
 
 def get_company_name(ticker):
-    if ticker in ticker_to_company:
-        return ticker_to_company.get(ticker, ticker)
-    else:
-        ticker
+    # Requests and the prewarmer send bare NSE symbols, the mapping has .NS
+    for name in (ticker, f"{ticker}.NS"):
+        if name in ticker_to_company:
+            return ticker_to_company[name]
+    return ticker
+
+
+CENTRAL_BANK_QUERIES = ["RBI interest rates", "global central banks interest rates"]
 
 
 def track_central_bank_news():
-    rbi_news = fetch_news("RBI interest rates")
-    global_news = fetch_news("global central banks interest rates")
+    rbi_news, global_news = [fetch_news(query) for query in CENTRAL_BANK_QUERIES]
+    return central_bank_sentiment(rbi_news, global_news)
+
+
+async def track_central_bank_news_async():
+    """track_central_bank_news with both feeds fetched concurrently."""
+    rbi_news, global_news = await rss_feed.fetch_many(CENTRAL_BANK_QUERIES)
+    return await asyncio.to_thread(central_bank_sentiment, rbi_news, global_news)
 
-    rbi_sentiment = np.mean(
-        [
-            analyze_sentiment(news["title"] + " " + news["description"])
-            for news in rbi_news
-        ]
-    )
-    global_sentiment = np.mean(
-        [
-            analyze_sentiment(news["title"] + " " + news["description"])
-            for news in global_news
-        ]
-    )
 
-    print("Stage 4")
-    print(rbi_sentiment, global_sentiment)
+def central_bank_sentiment(rbi_news, global_news):
+    rbi_sentiment = news_sentiment(rbi_news)
+    global_sentiment = news_sentiment(global_news)
+
+    logging.info(f"Stage 4: {rbi_sentiment} {global_sentiment}")
     return rbi_sentiment, global_sentiment
 
 
@@ -290,7 +235,36 @@ def adjust_bond_valuation(bond_item, rbi_sentiment, global_sentiment):
     return bond_item["quantity"] * adjustment_factor
 
 
+def portfolio_holdings(portfolio: Portfolio):
+    """PortfolioItems of the portfolio, with its lots summed per symbol."""
+    if portfolio.lots is None or not portfolio.lots.symbol:
+        return portfolio.items
+    store = LotStore.from_payload(portfolio.lots)
+    totals = {
+        (symbol, asset_type): quantity
+        for symbol, asset_type, quantity in zip(
+            store.symbols, store.types.tolist(), store.totals().tolist()
+        )
+    }
+    items = []
+    for item in portfolio.items:
+        key = (item.symbol, item.type)
+        items.append(
+            PortfolioItem(
+                symbol=item.symbol,
+                type=item.type,
+                quantity=item.quantity + totals.pop(key, 0.0),
+            )
+        )
+    items.extend(
+        PortfolioItem(symbol=symbol, type=asset_type, quantity=quantity)
+        for (symbol, asset_type), quantity in totals.items()
+    )
+    return items
+
+
 def rebalance_portfolio(portfolio: Portfolio):
+    holdings = portfolio_holdings(portfolio)
     risk_factor = portfolio.risk_factor
 
     # Define asset allocation based on risk factor
@@ -298,10 +272,10 @@ def rebalance_portfolio(portfolio: Portfolio):
     bond_allocation = (1 - risk_factor) * 0.3
     other_allocation = 1 - stock_allocation - bond_allocation
 
-    total_value = sum(item.quantity for item in portfolio.items)
+    total_value = sum(item.quantity for item in holdings)
 
     rebalanced_items = []
-    for item in portfolio.items:
+    for item in holdings:
         if item.type in ["stock", "etf", "mutual_fund"]:
             new_quantity = (
                 (item.quantity / total_value) * stock_allocation * total_value
@@ -322,83 +296,257 @@ def rebalance_portfolio(portfolio: Portfolio):
     return rebalanced_items
 
 
-def suggest_portfolio(rebalanced_items: List[Dict], risk_factor: float):
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None and CPU_WORKERS > 0:
+        # The pool starts on the first request, while to_thread workers may
+        # hold locks a forked child would inherit held, so workers are spawned
+        _process_pool = ProcessPoolExecutor(
+            max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def news_sentiment(news_list):
+    return np.mean(
+        [
+            analyze_sentiment(news["title"] + " " + news["description"])
+            for news in news_list
+        ]
+    )
+
+
+def build_suggestion(
+    item, risk_factor, predicted_risk, asset_sentiment, rbi_sentiment, global_sentiment
+):
+    asset_type = item["type"]
+    ticker = item["symbol"]
+
+    if predicted_risk is None:
+        return SuggestedItem(
+            symbol=ticker,
+            type=asset_type,
+            quantity=item["quantity"],
+            risk_percentage=0,
+        )
+
+    risk_adjustment = (predicted_risk / risk_factor) if risk_factor > 0 else 1
+    suggested_quantity = item["quantity"] * risk_adjustment
+
+    sentiment_adjustment = 1 + asset_sentiment * 0.1
+    suggested_quantity *= sentiment_adjustment
+
+    if asset_type == "bond":
+        suggested_quantity = adjust_bond_valuation(
+            item, rbi_sentiment, global_sentiment
+        )
+    elif asset_type == "crypto":
+        suggested_quantity = min(suggested_quantity, item["quantity"] * 1.5)
+    elif asset_type == "options":
+        suggested_quantity = min(suggested_quantity, item["quantity"] * 1.2)
+
+    return SuggestedItem(
+        symbol=ticker,
+        type=asset_type,
+        quantity=suggested_quantity,
+        risk_percentage=predicted_risk * 100,
+    )
+
+
+def merge_signals(signals, fallback):
+    """Fill signals with the risk and sentiment of fallback it does not have."""
+    for key, entry in fallback.items():
+        target = signals.setdefault(key, {})
+        for value, stamp in (
+            ("predicted_risk", "fetched_at"),
+            ("asset_sentiment", "sentiment_at"),
+        ):
+            if value not in target and value in entry:
+                target[value] = entry[value]
+                target[stamp] = entry[stamp]
+    return signals
+
+
+def needs_risk(rebalanced_items, signals):
+    """Items without a reusable predicted risk, the only ones whose prices are fetched."""
+    return [
+        item
+        for item in rebalanced_items
+        if "predicted_risk" not in signals.get((item["symbol"], item["type"]), {})
+    ]
+
+
+def suggest_portfolio(
+    rebalanced_items: List[Dict], risk_factor: float, signals: Optional[Dict] = None
+):
+    """Suggested items, computing each asset's predicted risk and sentiment.
+
+    signals maps (symbol, type) to previously computed predicted_risk and
+    asset_sentiment values to reuse, see rebalance_state. Values computed
+    here are added to it.
+    """
+    signals = {} if signals is None else signals
     suggested_items = []
     rbi_sentiment, global_sentiment = track_central_bank_news()
+    frames = fetch_bulk(needs_risk(rebalanced_items, signals))
 
     for item in rebalanced_items:
         asset_type = item["type"]
         ticker = item["symbol"]
         company_name = get_company_name(ticker)
 
-        data = fetch_data(ticker, asset_type=asset_type)
-
-        if data is not None:
-            predicted_risk = predict_risk(ticker, data, asset_type)
-            if predicted_risk is not None:
-                risk_adjustment = (
-                    (predicted_risk / risk_factor) if risk_factor > 0 else 1
-                )
-                suggested_quantity = item["quantity"] * risk_adjustment
-
-                asset_news = fetch_news(f"{company_name} stock")
-                asset_sentiment = np.mean(
-                    [
-                        analyze_sentiment(news["title"] + " " + news["description"])
-                        for news in asset_news
-                    ]
-                )
-                sentiment_adjustment = 1 + asset_sentiment * 0.1
-
-                suggested_quantity *= sentiment_adjustment
-
-                if asset_type == "bond":
-                    suggested_quantity = adjust_bond_valuation(
-                        item, rbi_sentiment, global_sentiment
-                    )
-                elif asset_type == "crypto":
-                    suggested_quantity = min(suggested_quantity, item["quantity"] * 1.5)
-                elif asset_type == "options":
-                    suggested_quantity = min(suggested_quantity, item["quantity"] * 1.2)
-
-                suggested_items.append(
-                    SuggestedItem(
-                        symbol=ticker,
-                        type=asset_type,
-                        quantity=suggested_quantity,
-                        risk_percentage=predicted_risk * 100,
-                    )
-                )
+        known = signals.setdefault((ticker, asset_type), {})
+        predicted_risk = known.get("predicted_risk")
+        asset_sentiment = known.get("asset_sentiment")
+
+        if "predicted_risk" not in known:
+            data = frames[(ticker, asset_type)]
+            if data is not None:
+                predicted_risk = predict_risk(ticker, data, asset_type)
+                known["predicted_risk"] = predicted_risk
+                if predicted_risk is None:
+                    logging.warning(f"Unable to predict risk for {ticker}")
             else:
-                logging.warning(f"Unable to predict risk for {ticker}")
-                suggested_items.append(
-                    SuggestedItem(
-                        symbol=ticker,
-                        type=asset_type,
-                        quantity=item["quantity"],
-                        risk_percentage=0,
-                    )
-                )
-        else:
-            logging.warning(f"Unable to fetch data for {ticker}")
-            suggested_items.append(
-                SuggestedItem(
-                    symbol=ticker,
-                    type=asset_type,
-                    quantity=item["quantity"],
-                    risk_percentage=0,
-                )
+                logging.warning(f"Unable to fetch data for {ticker}")
+        if predicted_risk is not None and "asset_sentiment" not in known:
+            asset_sentiment = news_sentiment(fetch_news(f"{company_name} stock"))
+            known["asset_sentiment"] = asset_sentiment
+
+        suggested_items.append(
+            build_suggestion(
+                item,
+                risk_factor,
+                predicted_risk,
+                asset_sentiment,
+                rbi_sentiment,
+                global_sentiment,
             )
+        )
 
     logging.info(f"Stage 6: Suggested items: {suggested_items}")
     return suggested_items
 
 
+async def suggest_portfolio_async(
+    rebalanced_items: List[Dict], risk_factor: float, signals: Optional[Dict] = None
+):
+    """Same result as suggest_portfolio, with every asset processed concurrently.
+
+    Price history comes from one batched download per source, news feeds
+    are fetched on the event loop through the shared RSS cache and model
+    training runs in the process pool, so the event loop never blocks.
+    """
+    loop = asyncio.get_running_loop()
+    io_limit = asyncio.Semaphore(IO_CONCURRENCY)
+
+    async def run_cpu(func, *args):
+        pool = get_process_pool()
+        if pool is None:
+            return await asyncio.to_thread(func, *args)
+        return await loop.run_in_executor(pool, func, *args)
+
+    signals = {} if signals is None else signals
+    central_bank = asyncio.create_task(track_central_bank_news_async())
+    frames = await asyncio.to_thread(fetch_bulk, needs_risk(rebalanced_items, signals))
+
+    async def suggest_item(item):
+        asset_type = item["type"]
+        ticker = item["symbol"]
+        company_name = get_company_name(ticker)
+
+        known = signals.setdefault((ticker, asset_type), {})
+        predicted_risk = known.get("predicted_risk")
+        asset_sentiment = known.get("asset_sentiment")
+
+        if "predicted_risk" not in known:
+            data = frames[(ticker, asset_type)]
+            if data is not None:
+                predicted_risk = await run_cpu(predict_risk, ticker, data, asset_type)
+                known["predicted_risk"] = predicted_risk
+                if predicted_risk is None:
+                    logging.warning(f"Unable to predict risk for {ticker}")
+            else:
+                logging.warning(f"Unable to fetch data for {ticker}")
+        if predicted_risk is not None and "asset_sentiment" not in known:
+            async with io_limit:
+                asset_news = await rss_feed.fetch(f"{company_name} stock")
+            asset_sentiment = await asyncio.to_thread(news_sentiment, asset_news)
+            known["asset_sentiment"] = asset_sentiment
+
+        rbi_sentiment, global_sentiment = await central_bank
+        return build_suggestion(
+            item,
+            risk_factor,
+            predicted_risk,
+            asset_sentiment,
+            rbi_sentiment,
+            global_sentiment,
+        )
+
+    try:
+        suggested_items = await asyncio.gather(
+            *(suggest_item(item) for item in rebalanced_items)
+        )
+        # Surface central bank errors even for portfolios with no items
+        await central_bank
+    finally:
+        if not central_bank.done():
+            central_bank.cancel()
+
+    logging.info(f"Stage 6: Suggested items: {suggested_items}")
+    return list(suggested_items)
+
+
+_prewarm_task = None
+
+
+@app.on_event("startup")
+def start_benchmark_refresh():
+    # Loaded benchmarks are reloaded in the background, not on a request
+    benchmark_returns.start_scheduler()
+
+
+@app.on_event("startup")
+async def start_prewarmer():
+    global _prewarm_task
+    if PREWARM_INTERVAL > 0:
+        _prewarm_task = asyncio.create_task(prewarmer.run())
+
+
+@app.on_event("shutdown")
+def shutdown_process_pool():
+    global _process_pool
+    if _prewarm_task is not None:
+        _prewarm_task.cancel()
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
 @app.post("/rebalance_and_suggest/", response_model=RebalancedPortfolio)
 async def rebalance_and_suggest(portfolio: Portfolio):
     try:
         rebalanced_items = rebalance_portfolio(portfolio)
-        suggested_items = suggest_portfolio(rebalanced_items, portfolio.risk_factor)
+        keys = [(item["symbol"], item["type"]) for item in rebalanced_items]
+        await asyncio.to_thread(market_signals.touch, keys)
+        # Values the prewarmer computed win over the user's older ones
+        signals = await asyncio.to_thread(market_signals.load, keys)
+        incremental = portfolio.incremental and portfolio.user_id is not None
+        if incremental:
+            merge_signals(
+                signals,
+                await asyncio.to_thread(rebalance_state.load, portfolio.user_id, keys),
+            )
+        if SUGGEST_MODE == "sequential":
+            suggested_items = suggest_portfolio(
+                rebalanced_items, portfolio.risk_factor, signals
+            )
+        else:
+            suggested_items = await suggest_portfolio_async(
+                rebalanced_items, portfolio.risk_factor, signals
+            )
+        if incremental:
+            await asyncio.to_thread(rebalance_state.save, portfolio.user_id, signals)
 
         valid_items = [item for item in suggested_items if item.risk_percentage > 0]
         invalid_items = [item for item in suggested_items if item.risk_percentage == 0]
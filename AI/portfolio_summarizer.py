@@ -1,10 +1,23 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
-import json
-import time
 import os
-from groq import Groq
+import re
+import json
+import asyncio
+import logging
+from llm_gateway import llm_gateway, LLM_MODEL
+from llm_cache import llm_cache
+from singleflight import SingleFlight, metrics as singleflight_metrics
+from retry import (
+    CircuitOpen,
+    InvalidResponse,
+    RetryError,
+    RetryPolicy,
+    retry_async,
+    metrics as retry_metrics,
+)
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -12,35 +25,22 @@ load_dotenv()
 
 app = FastAPI()
 
+prompt_flight = SingleFlight("summary_prompts")
 
-async def get_summary(prompt=""):
-    api_key = os.getenv("GROQ_API_KEY")
-    client = Groq(api_key=api_key)
-    try:
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                    + ". Given this data, provide a short summary, insights, and recommendations that will help me make better financial decisions. Focus only on the important points and provide the output in JSON format, section-wise, with each point in an array.",
-                }
-            ],
-            temperature=1,
-            max_tokens=8192,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
+SUMMARY_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("SUMMARY_MAX_ATTEMPTS", "3")),
+    deadline=float(os.getenv("SUMMARY_DEADLINE", "90")),
+)
+CURLY_QUOTES = str.maketrans(
+    {"\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'"}
+)
 
-        # Extract the response content
-        response_content = completion.choices[0].message.content
+SUMMARY_PROMPT = ". Given this data, provide a short summary, insights, and recommendations that will help me make better financial decisions. Focus only on the important points and provide the output in JSON format, section-wise, with each point in an array."
 
-        return response_content
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return None
+async def get_summary(prompt=""):
+    # Returns None on failure, the gateway logs the error
+    return await llm_gateway.complete(prompt + SUMMARY_PROMPT)
 
 
 def print_json_keys_values(json_data):
@@ -52,44 +52,162 @@ def print_json_keys_values(json_data):
             print_json_keys_values(item)
 
 
-def convert_to_json(summary_str):
-    summary_json = {}
-    current_key = None
-    current_array = []
+class SectionParser:
+    """Incremental version of the line-based summary parser.
 
-    for line in summary_str.splitlines():
+    feed() accepts arbitrary chunks of model output and returns the
+    (key, items) sections completed by them, so sections can be sent on
+    while the rest of the answer is still being generated.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self._buffer = ""
+        self._current_key = None
+        self._current_array = []
+
+    def feed(self, text):
+        lines = (self._buffer + text).splitlines(keepends=True)
+        # Keep an unterminated last line until the rest of it arrives
+        self._buffer = (
+            lines.pop() if lines and lines[-1].splitlines() == [lines[-1]] else ""
+        )
+        return [section for section in map(self._parse_line, lines) if section]
+
+    def close(self):
+        line, self._buffer = self._buffer, ""
+        section = self._parse_line(line)
+        return [section] if section else []
+
+    def _parse_line(self, line):
         line = line.strip()
         if not line:
-            continue
+            return None
         if line.startswith("{") or line.startswith("}"):
-            continue
+            return None
         elif line.endswith(": ["):
-            current_key = line[:-3].strip().strip('"')
-            current_array = []
-        elif line == "]":
-            summary_json[current_key] = current_array
-            current_key = None
-            current_array = []
-        elif current_key:
-            current_array.append(line.strip('"').strip(",").strip('"'))
-    return summary_json
+            self._current_key = line[:-3].strip().strip('"')
+            self._current_array = []
+        elif line in ("]", "],"):
+            section = (self._current_key, self._current_array)
+            self.sections[self._current_key] = self._current_array
+            self._current_key = None
+            self._current_array = []
+            return section
+        elif self._current_key:
+            self._current_array.append(line.strip('"').strip(",").strip('"'))
+        return None
+
+
+def convert_to_json(summary_str):
+    parser = SectionParser()
+    parser.feed(summary_str)
+    parser.close()
+    return parser.sections
+
+
+def extract_json(summary_str):
+    """Parse the model's answer into a dict of sections, repairing it if needed.
+
+    Tries strict JSON first, then the outermost {...} block with code fences,
+    trailing commas and curly quotes cleaned up, then the line parser.
+    """
+    try:
+        parsed = json.loads(summary_str)
+        if isinstance(parsed, dict) and parsed:
+            return parsed
+    except ValueError:
+        pass
+
+    start, end = summary_str.find("{"), summary_str.rfind("}")
+    if start != -1 and end > start:
+        candidate = re.sub(r",\s*([}\]])", r"\1", summary_str[start : end + 1])
+        # Curly quotes are only swapped as a last resort, they may be content
+        for text in (candidate, candidate.translate(CURLY_QUOTES)):
+            try:
+                parsed = json.loads(text)
+                if isinstance(parsed, dict) and parsed:
+                    return parsed
+            except ValueError:
+                pass
+
+    return convert_to_json(summary_str)
+
+
+def is_summary(payload):
+    """Whether payload is a non-empty dict of section name -> list of points."""
+    return (
+        isinstance(payload, dict)
+        and bool(payload)
+        and all(
+            isinstance(key, str) and isinstance(items, list)
+            for key, items in payload.items()
+        )
+    )
+
+
+def parse_summary(answer):
+    """The model's answer as a summary dict, None if it does not have that shape.
+
+    Both /processPrompt/ and its stream accept, return and cache only what
+    this returns.
+    """
+    summary_json = extract_json(answer)
+    return summary_json if is_summary(summary_json) else None
+
+
+def cached_summary(cache_key):
+    """The cached parse_summary result for cache_key, None if absent or malformed.
+
+    /processPrompt/ and its stream share the key, so both store the
+    parse_summary result and check the shape before replaying it.
+    """
+    cached = llm_cache.get(cache_key)
+    if cached is None:
+        return None
+    try:
+        payload = json.loads(cached)
+    except ValueError:
+        payload = None
+    if not is_summary(payload):
+        logging.warning(f"Ignoring malformed cached summary {cache_key}")
+        return None
+    return payload
+
+
+def cache_summary(cache_key, summary_json):
+    llm_cache.set(cache_key, json.dumps(summary_json))
 
 
 async def process_prompt(prompt):
-    summary = None
-    summary_json = None
-    while not summary_json:
+    # Monthly payloads repeat, only successfully parsed answers are cached
+    cache_key = llm_cache.key(LLM_MODEL, SUMMARY_PROMPT, prompt)
+    # SQLite may wait on a write lock, keep it off the event loop
+    cached = await asyncio.to_thread(cached_summary, cache_key)
+    if cached is not None:
+        return cached
+    # Identical prompts arriving together share one LLM call
+    return await prompt_flight.do(cache_key, _process_uncached, cache_key, prompt)
+
+
+async def _process_uncached(cache_key, prompt):
+    async def attempt():
         summary = await get_summary(prompt)
         if not summary:
-            print("Empty response, retrying...")
-            time.sleep(1)  # Wait for a second before retrying
-        summary_json = convert_to_json(summary)
-        if summary_json:
-            print("Converted JSON:", json.dumps(summary_json, indent=2))
-        else:
-            print("Failed to convert summary to JSON.")
-
-    print("Summary:", summary)
+            raise ValueError("Empty response")
+        summary_json = parse_summary(summary)
+        if summary_json is None:
+            raise InvalidResponse("Failed to convert summary to JSON.")
+        return summary_json
+
+    try:
+        summary_json = await retry_async(attempt, "groq", SUMMARY_RETRY_POLICY)
+    except RetryError as e:
+        logging.error(f"Failed to process prompt: {e}")
+        return None
+
+    logging.info(f"Converted JSON: {json.dumps(summary_json)}")
+    await asyncio.to_thread(cache_summary, cache_key, summary_json)
     return summary_json
 
 
@@ -99,13 +217,83 @@ class PromptRequest(BaseModel):
 
 @app.post("/processPrompt/")
 async def summarize(request: PromptRequest):
-    summary_json = await process_prompt(request.prompt)
+    try:
+        summary_json = await process_prompt(request.prompt)
+    except CircuitOpen:
+        raise HTTPException(status_code=503, detail="LLM upstream unavailable")
     if summary_json:
         return summary_json
     else:
         raise HTTPException(status_code=500, detail="Failed to process prompt")
 
 
+@app.get("/processPrompt/metrics/")
+async def summarizer_metrics():
+    return {
+        "retries": retry_metrics(),
+        "llm": llm_gateway.stats,
+        "llm_cache": llm_cache.metrics(),
+        "singleflight": singleflight_metrics(),
+    }
+
+
+def format_event(event, data, sse):
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+
+async def stream_prompt(prompt, sse=False):
+    """Yield each summary section as soon as the model finishes writing it.
+
+    Sections are sent as SectionParser completes them. The full answer is
+    then parsed with parse_summary, like /processPrompt/ does; sections it
+    finds that were not sent, or were sent with other items, are sent
+    again, and that parse is what gets cached.
+    """
+    cache_key = llm_cache.key(LLM_MODEL, SUMMARY_PROMPT, prompt)
+    cached = await asyncio.to_thread(cached_summary, cache_key)
+    if cached is not None:
+        for key, items in cached.items():
+            yield format_event("section", {"section": key, "items": items}, sse)
+        yield format_event("done", {"cached": True}, sse)
+        return
+
+    parser = SectionParser()
+    answer = []
+    try:
+        async for delta in llm_gateway.stream(prompt + SUMMARY_PROMPT):
+            answer.append(delta)
+            for key, items in parser.feed(delta):
+                yield format_event("section", {"section": key, "items": items}, sse)
+        for key, items in parser.close():
+            yield format_event("section", {"section": key, "items": items}, sse)
+    except Exception:
+        # Sections already sent cannot be retracted, so no retry here
+        yield format_event("error", {"detail": "Failed to process prompt"}, sse)
+        return
+
+    summary_json = parse_summary("".join(answer))
+    if summary_json is None:
+        yield format_event("error", {"detail": "Failed to process prompt"}, sse)
+        return
+    for key, items in summary_json.items():
+        if parser.sections.get(key) != items:
+            yield format_event("section", {"section": key, "items": items}, sse)
+    await asyncio.to_thread(cache_summary, cache_key, summary_json)
+    yield format_event("done", {"cached": False}, sse)
+
+
+@app.post("/processPrompt/stream/")
+async def summarize_stream(request: PromptRequest, http_request: Request):
+    """Stream sections as NDJSON, or as server-sent events if the client accepts them."""
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+    return StreamingResponse(
+        stream_prompt(request.prompt, sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
+
+
 # Test function
 async def test_process_prompt():
     sample_json = {
@@ -145,6 +333,7 @@ async def test_process_prompt():
 
 if __name__ == "__main__":
     import uvicorn
+
     # import asyncio
 
     # # Run the test
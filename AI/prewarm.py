@@ -0,0 +1,327 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import CACHE_DIR
+
+# Seconds between prewarm cycles in the service process, 0 leaves it to the
+# sidecar (python prewarm.py) or disables prewarming
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "0"))
+# Seconds a symbol seen in a request stays in the prewarmed universe
+PREWARM_TRACK_SECONDS = float(os.getenv("PREWARM_TRACK_SECONDS", str(7 * 86400)))
+# Upstream lookups per second (one per symbol downloaded or feed read)
+PREWARM_RATE = float(os.getenv("PREWARM_RATE", "2"))
+# Lookups allowed at once after an idle period
+PREWARM_BURST = int(os.getenv("PREWARM_BURST", "10"))
+# Symbols per batched price download
+PREWARM_BATCH_SIZE = int(os.getenv("PREWARM_BATCH_SIZE", "20"))
+# Seconds a precomputed risk or sentiment is served to requests
+MARKET_SIGNAL_MAX_AGE = float(os.getenv("MARKET_SIGNAL_MAX_AGE", str(6 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS market_signals (
+    symbol TEXT NOT NULL,
+    type TEXT NOT NULL,
+    predicted_risk REAL,
+    fetched_at REAL,
+    asset_sentiment REAL,
+    sentiment_at REAL,
+    requested_at REAL,
+    PRIMARY KEY (symbol, type)
+);
+"""
+
+
+class MarketSignals:
+    """Per-symbol risk and sentiment shared by every user, written by the prewarmer.
+
+    Requests record the symbols they see with touch() and read the
+    unexpired values with load(), in the format suggest_portfolio takes.
+    The table is on disk, so a sidecar prewarmer and any number of service
+    workers share it.
+    """
+
+    def __init__(self, path=None, max_age=MARKET_SIGNAL_MAX_AGE):
+        self.path = path or os.path.join(CACHE_DIR, "market_signals.sqlite")
+        self.max_age = max_age
+        self.stats = {"hits": 0, "misses": 0, "risk_stored": 0, "sentiment_stored": 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def touch(self, keys):
+        """Record a request for the (symbol, type) keys, adding them to the universe."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO market_signals (symbol, type, requested_at) "
+                "VALUES (?, ?, ?) ON CONFLICT (symbol, type) "
+                "DO UPDATE SET requested_at = excluded.requested_at",
+                [(symbol, asset_type, now) for symbol, asset_type in keys],
+            )
+
+    def requested(self, track_seconds=PREWARM_TRACK_SECONDS):
+        """(symbol, type) keys requested within track_seconds, most recent first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT symbol, type FROM market_signals WHERE requested_at >= ? "
+                "ORDER BY requested_at DESC",
+                (time.time() - track_seconds,),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def load(self, keys):
+        """{(symbol, type): unexpired predicted_risk/fetched_at and asset_sentiment/sentiment_at}."""
+        signals = {key: {} for key in keys}
+        if not signals:
+            return signals
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT symbol, type, predicted_risk, fetched_at, asset_sentiment, "
+                "sentiment_at FROM market_signals WHERE fetched_at >= ? "
+                "OR sentiment_at >= ?",
+                (time.time() - self.max_age,) * 2,
+            ).fetchall()
+
+        cutoff = time.time() - self.max_age
+        for symbol, asset_type, risk, fetched_at, sentiment, sentiment_at in rows:
+            entry = signals.get((symbol, asset_type))
+            if entry is None:
+                continue
+            if risk is not None and fetched_at >= cutoff:
+                entry["predicted_risk"] = risk
+                entry["fetched_at"] = fetched_at
+            if sentiment is not None and sentiment_at >= cutoff:
+                entry["asset_sentiment"] = sentiment
+                entry["sentiment_at"] = sentiment_at
+
+        hits = sum("predicted_risk" in entry for entry in signals.values())
+        with self._stats_lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(signals) - hits
+        return signals
+
+    def store_risk(self, rows):
+        """Store (symbol, type, predicted_risk) rows as fetched now."""
+        self._store("predicted_risk", "fetched_at", rows)
+        with self._stats_lock:
+            self.stats["risk_stored"] += len(rows)
+
+    def store_sentiment(self, rows):
+        """Store (symbol, type, asset_sentiment) rows as read now."""
+        self._store("asset_sentiment", "sentiment_at", rows)
+        with self._stats_lock:
+            self.stats["sentiment_stored"] += len(rows)
+
+    def _store(self, column, stamp, rows):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO market_signals (symbol, type, {column}, {stamp}) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (symbol, type) DO UPDATE SET "
+                f"{column} = excluded.{column}, {stamp} = excluded.{stamp}",
+                [
+                    (symbol, asset_type, value, now)
+                    for symbol, asset_type, value in rows
+                ],
+            )
+
+
+class TokenBucket:
+    """Paces upstream calls to rate per second, allowing bursts of capacity.
+
+    take(n) reserves n tokens and sleeps off any shortfall, so a batch of
+    n symbols costs the same as n single lookups.
+    """
+
+    def __init__(self, rate=PREWARM_RATE, capacity=PREWARM_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    async def take(self, n=1):
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= n
+            if self.tokens < 0 and self.rate > 0:
+                wait = -self.tokens / self.rate
+                self.waited += wait
+                await asyncio.sleep(wait)
+
+
+class Prewarmer:
+    """Keeps prices, predicted risk and news sentiment of a ticker universe fresh.
+
+    The universe is ticker_to_company plus the symbols requests touched
+    recently. Each cycle downloads prices in batches and predicts risk,
+    reads every symbol's news feed, and scrapes the finviz headlines of the
+    tickers the news service tracks, all paced by one token bucket so the
+    upstream rate limits are respected however large the universe grows.
+    """
+
+    def __init__(
+        self,
+        signals=None,
+        interval=PREWARM_INTERVAL,
+        batch_size=PREWARM_BATCH_SIZE,
+        bucket=None,
+    ):
+        self.signals = signals or market_signals
+        self.interval = interval
+        self.batch_size = batch_size
+        self.bucket = bucket or TokenBucket()
+        self.stats = {
+            "cycles": 0,
+            "errors": 0,
+            "symbols": 0,
+            "last_cycle_seconds": 0.0,
+            "paced_seconds": 0.0,
+        }
+
+    def universe(self):
+        from portfolio_rebalancing import ticker_to_company
+
+        keys = dict.fromkeys(self.signals.requested())
+        # Requests send bare NSE symbols, resolve_symbol adds .NS on download
+        keys.update(
+            dict.fromkeys(
+                (symbol.removesuffix(".NS"), "stock") for symbol in ticker_to_company
+            )
+        )
+        return list(keys)
+
+    async def refresh_risk(self, keys):
+        """Download prices batch by batch and store each symbol's predicted risk."""
+        from market_data import fetch_bulk
+        from portfolio_rebalancing import predict_risk
+
+        predicted = []
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start : start + self.batch_size]
+            await self.bucket.take(len(batch))
+            items = [
+                {"symbol": symbol, "type": asset_type} for symbol, asset_type in batch
+            ]
+            frames = await asyncio.to_thread(fetch_bulk, items)
+            rows = []
+            for key in batch:
+                data = frames.get(key)
+                if data is None:
+                    continue
+                risk = await asyncio.to_thread(predict_risk, key[0], data, key[1])
+                if risk is not None:
+                    rows.append((*key, float(risk)))
+            await asyncio.to_thread(self.signals.store_risk, rows)
+            predicted.extend(row[:2] for row in rows)
+        return predicted
+
+    async def refresh_sentiment(self, keys):
+        """Read each symbol's news feed and store its mean polarity."""
+        from portfolio_rebalancing import get_company_name, news_sentiment
+        from rss_feed import rss_feed
+
+        for symbol, asset_type in keys:
+            await self.bucket.take()
+            try:
+                articles = await rss_feed.fetch(f"{get_company_name(symbol)} stock")
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"Error prewarming news for {symbol}: {e}")
+                continue
+            sentiment = await asyncio.to_thread(news_sentiment, articles)
+            await asyncio.to_thread(
+                self.signals.store_sentiment, [(symbol, asset_type, float(sentiment))]
+            )
+
+    async def refresh_headlines(self):
+        """Scrape the finviz headlines of the tickers the news service tracks."""
+        from news import refresh_news
+        from news_store import news_store
+
+        due = await asyncio.to_thread(news_store.due)
+        for start in range(0, len(due), self.batch_size):
+            batch = due[start : start + self.batch_size]
+            await self.bucket.take(len(batch))
+            await refresh_news(batch)
+
+    async def run_once(self):
+        start = time.perf_counter()
+        waited = self.bucket.waited
+        keys = await asyncio.to_thread(self.universe)
+        predicted = await self.refresh_risk(keys)
+        # Requests only read sentiment for assets with a risk, as they compute it
+        await self.refresh_sentiment(predicted)
+        await self.refresh_headlines()
+        self.stats["cycles"] += 1
+        self.stats["symbols"] = len(keys)
+        self.stats["last_cycle_seconds"] = time.perf_counter() - start
+        self.stats["paced_seconds"] += self.bucket.waited - waited
+        logging.info(
+            f"Prewarmed {len(predicted)} of {len(keys)} symbols in "
+            f"{self.stats['last_cycle_seconds']:.1f}s"
+        )
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"Error prewarming market signals: {e}")
+            await asyncio.sleep(self.interval)
+
+
+market_signals = MarketSignals()
+prewarmer = Prewarmer()
+
+
+async def run_sidecar(once=False):
+    from http_client import http_client
+
+    try:
+        await (prewarmer.run_once() if once else prewarmer.run())
+    finally:
+        await http_client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(
+        description="Sidecar keeping the market signals table warm."
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=PREWARM_INTERVAL or 900,
+        help="seconds between cycles",
+    )
+    parser.add_argument("--once", action="store_true", help="run a single cycle")
+    args = parser.parse_args()
+
+    prewarmer.interval = args.interval
+    asyncio.run(run_sidecar(args.once))
@@ -0,0 +1,245 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from config import CACHE_DIR
+
+# Seconds before the last bar of a cached series is refreshed
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "3600"))
+# Total bars kept on disk before least recently used series are evicted
+PRICE_CACHE_MAX_ROWS = int(os.getenv("PRICE_CACHE_MAX_ROWS", "2000000"))
+# Series not read for this many seconds are dropped on the next eviction pass
+PRICE_CACHE_MAX_IDLE = float(os.getenv("PRICE_CACHE_MAX_IDLE", str(30 * 86400)))
+# Bytes of the database file SQLite may memory-map for reads
+PRICE_CACHE_MMAP_SIZE = int(os.getenv("PRICE_CACHE_MMAP_SIZE", str(256 * 1024**2)))
+
+COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Adj Close": "adj_close",
+    "Volume": "volume",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    symbol TEXT NOT NULL,
+    asset_type TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    adj_close REAL,
+    volume REAL,
+    PRIMARY KEY (symbol, asset_type, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (
+    symbol TEXT NOT NULL,
+    asset_type TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    last_ts INTEGER,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    n_rows INTEGER NOT NULL,
+    PRIMARY KEY (symbol, asset_type)
+);
+"""
+
+_PERIOD_RE = re.compile(r"^(\d+)(d|wk|mo|y)$")
+_PERIOD_DAYS = {"d": 1, "wk": 7, "mo": 30, "y": 365}
+
+
+def period_start(period, now=None):
+    """Translate a yfinance style period ("5d", "6mo", "1y") into a start date."""
+    match = _PERIOD_RE.match(period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    days = int(match.group(1)) * _PERIOD_DAYS[match.group(2)]
+    now = now or datetime.now()
+    return datetime(now.year, now.month, now.day) - timedelta(days=days)
+
+
+def _to_seconds(index):
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values.astype("datetime64[s]").astype("int64")
+
+
+class PriceCache:
+    """On-disk OHLCV store keyed by (symbol, asset_type).
+
+    A cached series is served as-is until it is older than the TTL, after
+    which only the bars from the last cached date onwards are downloaded and
+    merged in. The database is read through SQLite's memory-mapped I/O.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        ttl=PRICE_CACHE_TTL,
+        max_rows=PRICE_CACHE_MAX_ROWS,
+        max_idle=PRICE_CACHE_MAX_IDLE,
+    ):
+        self.path = path or os.path.join(CACHE_DIR, "prices.sqlite")
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.max_idle = max_idle
+        self.stats = {"hits": 0, "refreshes": 0, "misses": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute(f"PRAGMA mmap_size={PRICE_CACHE_MMAP_SIZE}")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def plan(self, symbol, asset_type, start):
+        """Decide what a read from start needs: ("hit" | "refresh" | "miss", since, start_ts).
+
+        since is the date to download from, start_ts the window start to
+        record for the series once the download is stored.
+        """
+        start_ts = int(pd.Timestamp(start).timestamp())
+        with self._connect() as conn:
+            meta = conn.execute(
+                "SELECT start_ts, last_ts, fetched_at FROM series "
+                "WHERE symbol = ? AND asset_type = ?",
+                (symbol, asset_type),
+            ).fetchone()
+
+        covered = meta is not None and meta[0] <= start_ts and meta[1] is not None
+        if covered and time.time() - meta[2] < self.ttl:
+            self._count("hits")
+            return "hit", None, meta[0]
+        if covered:
+            self._count("refreshes")
+            return "refresh", pd.to_datetime(meta[1], unit="s").to_pydatetime(), meta[0]
+        self._count("misses")
+        return "miss", pd.Timestamp(start).to_pydatetime(), start_ts
+
+    def fetch(self, symbol, asset_type, start, download):
+        """Return bars for symbol from start onwards, downloading only what is missing.
+
+        download(since) must return a DataFrame indexed by date with any of
+        the OHLCV columns, or raise when the upstream fails.
+        """
+        status, since, series_start = self.plan(symbol, asset_type, start)
+        if status == "refresh":
+            try:
+                self.store(symbol, asset_type, download(since), series_start)
+            except Exception as e:
+                # A stale series is still better than no series
+                logging.warning(
+                    f"Refresh failed for {symbol}, serving cached bars: {e}"
+                )
+        elif status == "miss":
+            self.store(symbol, asset_type, download(since), series_start, replace=True)
+            self.evict()
+
+        return self.read(symbol, asset_type, int(pd.Timestamp(start).timestamp()))
+
+    def read(self, symbol, asset_type, start_ts=0):
+        with self._connect() as conn:
+            data = pd.read_sql_query(
+                "SELECT ts, open, high, low, close, adj_close, volume FROM bars "
+                "WHERE symbol = ? AND asset_type = ? AND ts >= ? ORDER BY ts",
+                conn,
+                params=(symbol, asset_type, start_ts),
+            )
+            conn.execute(
+                "UPDATE series SET accessed_at = ? WHERE symbol = ? AND asset_type = ?",
+                (time.time(), symbol, asset_type),
+            )
+        data.index = pd.DatetimeIndex(
+            pd.to_datetime(data.pop("ts"), unit="s"), name="Date"
+        )
+        data = data.rename(columns={v: k for k, v in COLUMNS.items()})
+        # Drop the columns this source never provides (e.g. OHLC for crypto)
+        return data.dropna(axis=1, how="all")
+
+    def store(self, symbol, asset_type, data, start_ts, replace=False):
+        """Upsert downloaded bars, or replace the whole series when replace is set."""
+        rows = []
+        if data is not None and not data.empty:
+            frame = data.reindex(columns=list(COLUMNS)).astype(float)
+            frame = frame.astype(object).where(frame.notna(), None)
+            rows = [
+                (symbol, asset_type, int(ts), *values)
+                for ts, values in zip(
+                    _to_seconds(frame.index), frame.itertuples(index=False)
+                )
+            ]
+        now = time.time()
+        with self._connect() as conn:
+            if replace:
+                conn.execute(
+                    "DELETE FROM bars WHERE symbol = ? AND asset_type = ?",
+                    (symbol, asset_type),
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            last_ts, n_rows = conn.execute(
+                "SELECT MAX(ts), COUNT(*) FROM bars WHERE symbol = ? AND asset_type = ?",
+                (symbol, asset_type),
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (symbol, asset_type, start_ts, last_ts, now, now, n_rows),
+            )
+
+    def evict(self):
+        """Drop idle series, then least recently used ones until under max_rows."""
+        cutoff = time.time() - self.max_idle
+        with self._connect() as conn:
+            victims = conn.execute(
+                "SELECT symbol, asset_type FROM series WHERE accessed_at < ?",
+                (cutoff,),
+            ).fetchall()
+            total = conn.execute(
+                "SELECT COALESCE(SUM(n_rows), 0) FROM series WHERE accessed_at >= ?",
+                (cutoff,),
+            ).fetchone()[0]
+            if total > self.max_rows:
+                for symbol, asset_type, n_rows in conn.execute(
+                    "SELECT symbol, asset_type, n_rows FROM series "
+                    "WHERE accessed_at >= ? ORDER BY accessed_at",
+                    (cutoff,),
+                ).fetchall():
+                    if total <= self.max_rows:
+                        break
+                    victims.append((symbol, asset_type))
+                    total -= n_rows
+            for key in victims:
+                conn.execute(
+                    "DELETE FROM bars WHERE symbol = ? AND asset_type = ?", key
+                )
+                conn.execute(
+                    "DELETE FROM series WHERE symbol = ? AND asset_type = ?", key
+                )
+        if victims:
+            with self._stats_lock:
+                self.stats["evictions"] += len(victims)
+            logging.info(f"Evicted {len(victims)} series from the price cache")
@@ -0,0 +1,147 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import CACHE_DIR
+
+# Seconds a holding's predicted risk is reused before its prices are refetched
+REBALANCE_RISK_MAX_AGE = float(os.getenv("REBALANCE_RISK_MAX_AGE", str(3 * 86400)))
+# Seconds a holding's news sentiment is reused before its feed is read again
+REBALANCE_SENTIMENT_MAX_AGE = float(
+    os.getenv("REBALANCE_SENTIMENT_MAX_AGE", str(36 * 3600))
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS asset_signals (
+    user_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    type TEXT NOT NULL,
+    predicted_risk REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    asset_sentiment REAL,
+    sentiment_at REAL,
+    PRIMARY KEY (user_id, symbol, type)
+);
+"""
+
+
+class RebalanceState:
+    """Per-user signals of the last incremental /rebalance_and_suggest/ run.
+
+    A holding's predicted risk and news sentiment do not depend on its
+    quantity or the user's risk factor, so they are reused until they
+    expire; only new holdings and expired signals are computed again. Risk
+    and sentiment expire separately, so fresh news does not imply a price
+    download. Rows of holdings no longer in the portfolio are dropped when
+    the run is saved.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        risk_max_age=REBALANCE_RISK_MAX_AGE,
+        sentiment_max_age=REBALANCE_SENTIMENT_MAX_AGE,
+    ):
+        self.path = path or os.path.join(CACHE_DIR, "rebalance_state.sqlite")
+        self.risk_max_age = risk_max_age
+        self.sentiment_max_age = sentiment_max_age
+        self.stats = {
+            "risk_reused": 0,
+            "risk_computed": 0,
+            "sentiment_reused": 0,
+            "sentiment_computed": 0,
+        }
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, user_id, keys):
+        """Unexpired signals of the (symbol, type) keys, as suggest_portfolio takes them.
+
+        A key's dict has predicted_risk/fetched_at while the risk is fresh
+        and asset_sentiment/sentiment_at while the sentiment is; keys with
+        nothing reusable map to an empty dict.
+        """
+        signals = {key: {} for key in keys}
+        if not signals:
+            return signals
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT symbol, type, predicted_risk, fetched_at, asset_sentiment, "
+                "sentiment_at FROM asset_signals WHERE user_id = ?",
+                (str(user_id),),
+            ).fetchall()
+
+        now = time.time()
+        for symbol, asset_type, risk, fetched_at, sentiment, sentiment_at in rows:
+            entry = signals.get((symbol, asset_type))
+            if entry is None:
+                continue
+            if now - fetched_at < self.risk_max_age:
+                entry["predicted_risk"] = risk
+                entry["fetched_at"] = fetched_at
+            if sentiment_at is not None and now - sentiment_at < self.sentiment_max_age:
+                entry["asset_sentiment"] = sentiment
+                entry["sentiment_at"] = sentiment_at
+
+        risk_reused = sum("predicted_risk" in entry for entry in signals.values())
+        sentiment_reused = sum("asset_sentiment" in entry for entry in signals.values())
+        with self._stats_lock:
+            self.stats["risk_reused"] += risk_reused
+            self.stats["risk_computed"] += len(signals) - risk_reused
+            self.stats["sentiment_reused"] += sentiment_reused
+            self.stats["sentiment_computed"] += len(signals) - sentiment_reused
+        return signals
+
+    def save(self, user_id, signals):
+        """Store signals as the user's state, replacing the previous run's.
+
+        Entries without a timestamp were just computed and are stamped now.
+        Holdings whose risk could not be predicted are not stored, so they
+        are retried on the next run.
+        """
+        now = time.time()
+        rows = [
+            (
+                str(user_id),
+                symbol,
+                asset_type,
+                entry["predicted_risk"],
+                entry.get("fetched_at", now),
+                entry.get("asset_sentiment"),
+                (
+                    entry.get("sentiment_at", now)
+                    if entry.get("asset_sentiment") is not None
+                    else None
+                ),
+            )
+            for (symbol, asset_type), entry in signals.items()
+            if entry.get("predicted_risk") is not None
+        ]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM asset_signals WHERE user_id = ?", (str(user_id),))
+            conn.executemany(
+                "INSERT INTO asset_signals VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def forget(self, user_id):
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM asset_signals WHERE user_id = ?", (str(user_id),)
+            ).rowcount
+
+
+rebalance_state = RebalanceState()
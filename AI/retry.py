@@ -0,0 +1,195 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+
+# Consecutive upstream failures before a circuit opens
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Seconds an open circuit rejects calls before letting a trial call through
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+
+class RetryError(Exception):
+    """Raised when every attempt failed or the deadline ran out."""
+
+
+class CircuitOpen(Exception):
+    """Raised without calling the upstream while its circuit is open."""
+
+
+class InvalidResponse(Exception):
+    """The upstream answered but the answer is unusable.
+
+    Retried like any failure, but does not count against the circuit since
+    the upstream itself is healthy.
+    """
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, deadline=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def delay(self, attempt):
+        # Full jitter: spreads out retries from concurrent requests
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """Closed -> open after threshold failures -> half-open after reset_timeout.
+
+    While half-open a single trial call is let through; the others are
+    rejected until it succeeds or fails. A trial that never reports back,
+    e.g. a cancelled request, is replaced after another reset_timeout.
+    """
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state != "half_open":
+                return state == "closed"
+            now = time.monotonic()
+            if (
+                self.probe_started is not None
+                and now - self.probe_started < self.reset_timeout
+            ):
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # A failed half-open trial re-opens the circuit for another period
+                if self.opened_at is None:
+                    logging.warning(f"Circuit for {self.name} opened")
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_stats = {}
+_registry_lock = threading.Lock()
+
+
+def circuit_breaker(name):
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def _count(name, outcome):
+    with _registry_lock:
+        stats = _stats.setdefault(
+            name,
+            {
+                "attempts": 0,
+                "retries": 0,
+                "successes": 0,
+                "invalid": 0,
+                "errors": 0,
+                "exhausted": 0,
+                "deadline_exceeded": 0,
+                "circuit_open": 0,
+            },
+        )
+        stats[outcome] += 1
+
+
+async def retry_async(func, name, policy):
+    """Await func() until it succeeds, per policy, guarded by name's circuit.
+
+    Raises CircuitOpen when the circuit rejects the call and RetryError once
+    attempts or the deadline run out.
+    """
+    breaker = circuit_breaker(name)
+    deadline = time.monotonic() + policy.deadline
+    last_error = None
+
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            _count(name, "circuit_open")
+            raise CircuitOpen(f"Circuit for {name} is open")
+        if attempt:
+            _count(name, "retries")
+        _count(name, "attempts")
+
+        try:
+            result = await asyncio.wait_for(func(), deadline - time.monotonic())
+        except InvalidResponse as e:
+            # The upstream answered, which also ends a half-open trial
+            breaker.record_success()
+            _count(name, "invalid")
+            last_error = e
+        except asyncio.TimeoutError as e:
+            breaker.record_failure()
+            _count(name, "deadline_exceeded")
+            raise RetryError(f"{name} deadline of {policy.deadline}s exceeded") from e
+        except Exception as e:
+            breaker.record_failure()
+            _count(name, "errors")
+            last_error = e
+        else:
+            breaker.record_success()
+            _count(name, "successes")
+            return result
+
+        delay = policy.delay(attempt)
+        if attempt + 1 < policy.max_attempts:
+            if time.monotonic() + delay >= deadline:
+                _count(name, "deadline_exceeded")
+                raise RetryError(
+                    f"{name} deadline of {policy.deadline}s exceeded"
+                ) from last_error
+            logging.warning(f"{name} attempt {attempt + 1} failed: {last_error}")
+            await asyncio.sleep(delay)
+
+    _count(name, "exhausted")
+    raise RetryError(
+        f"{name} failed after {policy.max_attempts} attempts: {last_error}"
+    ) from last_error
+
+
+def metrics():
+    with _registry_lock:
+        return {
+            name: {
+                **_stats.get(name, {}),
+                "circuit": _breakers[name].state if name in _breakers else "closed",
+            }
+            for name in set(_stats) | set(_breakers)
+        }
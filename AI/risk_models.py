@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_DIR
+from feature_panel import build_panels
+
+# Feature rows needed before a model is trained at all
+MIN_TRAINING_ROWS = 100
+# New bars since the last fit that trigger a retrain
+RISK_MODEL_RETRAIN_AFTER = int(os.getenv("RISK_MODEL_RETRAIN_AFTER", "5"))
+# Fitted models kept in memory per process
+RISK_MODEL_LRU_SIZE = int(os.getenv("RISK_MODEL_LRU_SIZE", "64"))
+# Old versions kept on disk per key, for rollback
+RISK_MODEL_KEEP_VERSIONS = int(os.getenv("RISK_MODEL_KEEP_VERSIONS", "3"))
+# "symbol" keeps one model per symbol, "asset_type" one per asset class
+RISK_MODEL_SCOPE = os.getenv("RISK_MODEL_SCOPE", "symbol")
+
+
+def build_features(data):
+    """Return (features, future_volatility) as used to train the risk model."""
+    returns = data["Close"].pct_change().dropna()
+    log_returns = np.log(1 + returns)
+    volatility = returns.rolling(window=30).std() * np.sqrt(252)
+    ma_50 = data["Close"].rolling(window=50).mean()
+    ma_200 = data["Close"].rolling(window=200).mean()
+
+    features = pd.DataFrame(
+        {
+            "log_returns": log_returns,
+            "volatility": volatility,
+            "ma_50": ma_50,
+            "ma_200": ma_200,
+            "volume": data["Volume"],
+        }
+    ).dropna()
+
+    # Prepare target (future volatility)
+    future_volatility = volatility.shift(-30).dropna()
+
+    # Align features and target
+    features = features[:-30]
+    future_volatility = future_volatility[: len(features)]
+    return features, future_volatility
+
+
+def fit_risk_model(features, future_volatility):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    # Train on the first 80%, the rest is held out as in the original split
+    train_size = int(len(features) * 0.8)
+    X_train = features[:train_size]
+    y_train = future_volatility[:train_size]
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+
+    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    model.fit(X_train_scaled, y_train)
+    return model, scaler
+
+
+def model_key(symbol, asset_type):
+    if RISK_MODEL_SCOPE == "asset_type":
+        return f"class_{asset_type}"
+    return symbol
+
+
+class RiskModelRegistry:
+    """Versioned on-disk store of fitted risk models with an in-process LRU.
+
+    Each key (a symbol or an asset class) has numbered versions under
+    <directory>/<key>/. A stored model is reused until the caller's data has
+    retrain_after bars newer than the last bar it was trained on.
+
+    The LRU and stats are per process: with REBALANCE_CPU_WORKERS > 0 the
+    models are trained and loaded in pool workers, each with its own
+    registry, so the service's stats only count what ran in the service
+    process itself. The on-disk versions are shared by every process.
+    """
+
+    def __init__(
+        self,
+        directory=None,
+        retrain_after=RISK_MODEL_RETRAIN_AFTER,
+        lru_size=RISK_MODEL_LRU_SIZE,
+        keep_versions=RISK_MODEL_KEEP_VERSIONS,
+    ):
+        self.directory = directory or os.path.join(CACHE_DIR, "risk_models")
+        self.retrain_after = retrain_after
+        self.lru_size = lru_size
+        self.keep_versions = keep_versions
+        self._warm = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"warm_hits": 0, "disk_loads": 0, "trainings": 0}
+
+    def _key_dir(self, key):
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.=-]", "_", key))
+
+    def _remember(self, key, entry, stat):
+        with self._lock:
+            self.stats[stat] += 1
+            self._warm[key] = entry
+            self._warm.move_to_end(key)
+            while len(self._warm) > self.lru_size:
+                self._warm.popitem(last=False)
+
+    def load(self, key, version=None):
+        """Return the stored entry for key (latest version by default) or None."""
+        if version is None:
+            with self._lock:
+                entry = self._warm.get(key)
+                if entry is not None:
+                    self._warm.move_to_end(key)
+                    self.stats["warm_hits"] += 1
+                    return entry
+            try:
+                with open(os.path.join(self._key_dir(key), "latest.json")) as f:
+                    version = json.load(f)["version"]
+            except (OSError, ValueError, KeyError):
+                return None
+        import joblib
+
+        path = os.path.join(self._key_dir(key), f"v{version}.joblib")
+        try:
+            entry = joblib.load(path)
+        except Exception as e:
+            logging.warning(f"Unable to load risk model {path}: {e}")
+            return None
+        self._remember(key, entry, "disk_loads")
+        return entry
+
+    def train(self, key, features, future_volatility):
+        """Fit a new version for key, persist it and make it the latest."""
+        import joblib
+
+        model, scaler = fit_risk_model(features, future_volatility)
+        previous = self.load(key)
+        entry = {
+            "model": model,
+            "scaler": scaler,
+            "version": previous["version"] + 1 if previous else 1,
+            "trained_at": time.time(),
+            "last_date": features.index[-1],
+            "n_rows": len(features),
+        }
+
+        key_dir = self._key_dir(key)
+        os.makedirs(key_dir, exist_ok=True)
+        path = os.path.join(key_dir, f"v{entry['version']}.joblib")
+        # Write then rename so other processes never see a partial file
+        joblib.dump(entry, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        with open(os.path.join(key_dir, "latest.json.tmp"), "w") as f:
+            json.dump(
+                {
+                    "version": entry["version"],
+                    "trained_at": entry["trained_at"],
+                    "last_date": str(entry["last_date"]),
+                    "n_rows": entry["n_rows"],
+                },
+                f,
+            )
+        os.replace(
+            os.path.join(key_dir, "latest.json.tmp"),
+            os.path.join(key_dir, "latest.json"),
+        )
+        stale = entry["version"] - self.keep_versions
+        if stale > 0 and os.path.exists(os.path.join(key_dir, f"v{stale}.joblib")):
+            os.remove(os.path.join(key_dir, f"v{stale}.joblib"))
+
+        self._remember(key, entry, "trainings")
+        logging.info(f"Trained risk model {key} v{entry['version']}")
+        return entry
+
+    def get_or_train(self, key, features, future_volatility):
+        entry = self.load(key)
+        if entry is not None:
+            new_bars = (features.index > entry["last_date"]).sum()
+            if new_bars < self.retrain_after:
+                return entry
+        return self.train(key, features, future_volatility)
+
+    def predict(self, key, features, future_volatility):
+        """Predict future volatility for the last feature row."""
+        entry = self.get_or_train(key, features, future_volatility)
+        last_data_point = entry["scaler"].transform(
+            features.iloc[-1].values.reshape(1, -1)
+        )
+        return entry["model"].predict(last_data_point)[0]
+
+
+def train_batch(items, registry, period="1y"):
+    """Retrain every key for items, e.g. from a nightly job.
+
+    With RISK_MODEL_SCOPE=asset_type the feature rows of all symbols of a
+    type are pooled into one model.
+    """
+    from market_data import fetch_bulk
+
+    frames = fetch_bulk(items, period=period)
+    keys = {}
+    symbol_frames = {}
+    for item in items:
+        data = frames.get((item["symbol"], item["type"]))
+        if data is not None:
+            keys[item["symbol"]] = model_key(item["symbol"], item["type"])
+            symbol_frames[item["symbol"]] = data
+
+    # One rolling pass per trading calendar instead of one per symbol
+    pooled = {}
+    for panel in build_panels(symbol_frames):
+        for symbol in panel.symbols:
+            pooled.setdefault(keys[symbol], []).append(panel.frame(symbol))
+
+    trained = []
+    for key, parts in pooled.items():
+        features = pd.concat([part[0] for part in parts])
+        future_volatility = pd.concat([part[1] for part in parts])
+        if len(features) < MIN_TRAINING_ROWS:
+            logging.warning(f"Not enough data points to train {key}, skipping.")
+            continue
+        if len(parts) > 1:
+            # Keep the newest rows last so last_date reflects the freshest bar
+            order = np.argsort(features.index.values, kind="stable")
+            features = features.iloc[order]
+            future_volatility = future_volatility.iloc[order]
+        registry.train(key, features, future_volatility)
+        trained.append(key)
+    return trained
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description="Retrain stored risk models.")
+    parser.add_argument(
+        "symbols",
+        nargs="*",
+        help="SYMBOL or SYMBOL:TYPE (default type stock), defaults to the known tickers",
+    )
+    parser.add_argument("--period", default="1y")
+    args = parser.parse_args()
+
+    if args.symbols:
+        items = []
+        for spec in args.symbols:
+            symbol, _, asset_type = spec.partition(":")
+            items.append({"symbol": symbol, "type": asset_type or "stock"})
+    else:
+        from portfolio_rebalancing import ticker_to_company
+
+        items = [{"symbol": symbol, "type": "stock"} for symbol in ticker_to_company]
+
+    trained = train_batch(items, RiskModelRegistry(), period=args.period)
+    logging.info(f"Trained {len(trained)} risk models: {trained}")
@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import quote_plus
+
+from lxml import etree
+
+from singleflight import SingleFlight
+
+GOOGLE_NEWS_RSS = (
+    "https://news.google.com/rss/search?q={query}&hl=en-IN&gl=IN&ceid=IN:en"
+)
+# Seconds a query's articles are served from memory before being refetched
+RSS_CACHE_TTL = float(os.getenv("RSS_CACHE_TTL", "900"))
+# Queries kept in memory, oldest fetched are dropped first
+RSS_CACHE_MAX_ENTRIES = int(os.getenv("RSS_CACHE_MAX_ENTRIES", "2000"))
+
+
+def parse_rss(content):
+    """Every <item> of an RSS document as title/link/pub_date/description dicts."""
+    root = etree.fromstring(content, etree.XMLParser(recover=True))
+    if root is None:
+        return []
+    return [
+        {
+            "title": item.findtext("title", ""),
+            "link": item.findtext("link", ""),
+            "pub_date": item.findtext("pubDate", ""),
+            "description": item.findtext("description", ""),
+        }
+        for item in root.iter("item")
+    ]
+
+
+class RssFeed:
+    """Google News RSS search with a per-query TTL cache.
+
+    Queries such as the central bank ones are identical for every user, so
+    they are fetched once per TTL for the whole process. Concurrent async
+    lookups of the same query share one download, and if a refresh fails
+    the expired articles keep being served.
+    """
+
+    def __init__(self, ttl=RSS_CACHE_TTL, max_entries=RSS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("rss_feed")
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def url(self, query):
+        return GOOGLE_NEWS_RSS.format(query=quote_plus(query))
+
+    def _lookup(self, query):
+        """(fresh articles or None, stale entry or None)."""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                self.stats["hits"] += 1
+                return entry[1], None
+            self.stats["misses"] += 1
+            return None, entry
+
+    def _store(self, query, articles):
+        with self._lock:
+            self._entries[query] = (time.time(), articles)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return articles
+
+    def _failed(self, query, entry, error):
+        with self._lock:
+            self.stats["errors"] += 1
+        if entry is None:
+            raise error
+        logging.error(f"Error refreshing news for {query!r}, serving cached: {error}")
+        return entry[1]
+
+    async def _download(self, query, entry):
+        from http_client import http_client
+
+        try:
+            content = await http_client.get_bytes(self.url(query))
+        except Exception as e:
+            return self._failed(query, entry, e)
+        return self._store(query, parse_rss(content))
+
+    async def fetch(self, query, num_articles=5):
+        articles, entry = self._lookup(query)
+        if articles is None:
+            articles = await self._flight.do(query, self._download, query, entry)
+        return articles[:num_articles]
+
+    async def fetch_many(self, queries, num_articles=5):
+        """Articles of every query, fetched concurrently, in query order."""
+        return await asyncio.gather(*(self.fetch(q, num_articles) for q in queries))
+
+    def fetch_blocking(self, query, num_articles=5):
+        """fetch() for synchronous callers, sharing the same cache."""
+        import requests
+
+        articles, entry = self._lookup(query)
+        if articles is None:
+            try:
+                response = requests.get(self.url(query), timeout=15)
+                response.raise_for_status()
+                articles = self._store(query, parse_rss(response.content))
+            except Exception as e:
+                articles = self._failed(query, entry, e)
+        return articles[:num_articles]
+
+
+rss_feed = RssFeed()
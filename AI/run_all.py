@@ -1,3 +1,4 @@
+import os
 import subprocess
 import signal
 import sys
@@ -5,9 +6,18 @@ import time
 
 processes = []
 
+# Ports each script binds in its own __main__ block
+SERVICES = [
+    ("news.py", 8000),
+    ("portfolio_rebalancing.py", 8001),
+    ("portfolio_summarizer.py", 8003),
+    ("tax_saving.py", 8004),
+]
+
 
 def start_server(script_name, port):
-    process = subprocess.Popen(["python", script_name])
+    process = subprocess.Popen([sys.executable, script_name])
+    print(f"Started {script_name} on port {port}")
     processes.append(process)
 
 
@@ -20,17 +30,10 @@ def terminate_processes(signal, frame):
     sys.exit(0)
 
 
-if __name__ == "__main__":
-    services = [
-        ("news.py", 8000),
-        ("portfolio_rebalancing.py", 8001),
-        ("portfolio_summarizer.py", 8002),
-        ("tax_saving.py", 8003),
-    ]
-
+def run_separate():
     signal.signal(signal.SIGINT, terminate_processes)
 
-    for script, port in services:
+    for script, port in SERVICES:
         start_server(script, port)
 
     # Keep the main thread alive to catch signals
@@ -39,3 +42,13 @@ if __name__ == "__main__":
             time.sleep(1)
     except KeyboardInterrupt:
         terminate_processes(None, None)
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if "--separate" in sys.argv:
+        # One interpreter per service, each on its own port
+        run_separate()
+    else:
+        # Every service in one process, see server.py for --port/--workers
+        os.execv(sys.executable, [sys.executable, "server.py", *sys.argv[1:]])
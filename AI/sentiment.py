@@ -0,0 +1,117 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Where the VADER lexicon is provisioned, see cold_start.py provision
+NLTK_DATA_DIR = os.getenv(
+    "NLTK_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data"),
+)
+# Download the lexicon on first use when it was not provisioned, off so a
+# service never touches the network for it
+NLTK_AUTO_DOWNLOAD = os.getenv("NLTK_AUTO_DOWNLOAD", "0") == "1"
+# Headline scores kept in memory, finviz repeats headlines across requests
+SENTIMENT_MEMO_SIZE = int(os.getenv("SENTIMENT_MEMO_SIZE", "50000"))
+
+
+def ensure_vader_lexicon(download=NLTK_AUTO_DOWNLOAD):
+    import nltk
+
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    try:
+        nltk.data.find("sentiment/vader_lexicon.zip")
+        return
+    except LookupError:
+        pass
+    if download:
+        logging.warning(
+            f"vader_lexicon not provisioned, downloading to {NLTK_DATA_DIR}"
+        )
+        nltk.download("vader_lexicon", download_dir=NLTK_DATA_DIR, quiet=True)
+    try:
+        # nltk.download reports failures instead of raising
+        nltk.data.find("sentiment/vader_lexicon.zip")
+    except LookupError:
+        raise LookupError(
+            f"vader_lexicon is not in {NLTK_DATA_DIR}, run `python cold_start.py "
+            "provision` when building the image or set NLTK_AUTO_DOWNLOAD=1"
+        ) from None
+
+
+class SentimentEngine:
+    """VADER scoring with one shared analyzer and a headline -> score memo.
+
+    Scores are the normalized compound, (1 - compound) / 2, as the
+    /getSentiment/ endpoint has always reported them.
+    """
+
+    def __init__(self, memo_size=SENTIMENT_MEMO_SIZE):
+        self.memo_size = memo_size
+        self._analyzer = None
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memo_hits": 0, "scored": 0}
+
+    @property
+    def analyzer(self):
+        """Load nltk and the VADER lexicon on first use instead of at import."""
+        with self._lock:
+            if self._analyzer is None:
+                from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+                ensure_vader_lexicon()
+                self._analyzer = SentimentIntensityAnalyzer()
+        return self._analyzer
+
+    def score(self, headlines):
+        """Return the normalized score of every headline, in order."""
+        headlines = list(headlines)
+        scores = {}
+        with self._lock:
+            for headline in headlines:
+                if headline in self._memo and headline not in scores:
+                    self._memo.move_to_end(headline)
+                    scores[headline] = self._memo[headline]
+            self.stats["memo_hits"] += len(scores)
+
+        missing = [h for h in dict.fromkeys(headlines) if h not in scores]
+        if missing:
+            polarity = self.analyzer.polarity_scores
+            fresh = {h: (1 - polarity(h)["compound"]) / 2 for h in missing}
+            scores.update(fresh)
+            with self._lock:
+                self.stats["scored"] += len(fresh)
+                self._memo.update(fresh)
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+
+        return [scores[h] for h in headlines]
+
+    def ticker_sentiment(self, news):
+        """Mean score of each ticker's headlines on its most recent date.
+
+        news has the Ticker/Date/Headline columns of fetch_news_data. Tickers
+        keep the order in which they first appear.
+        """
+        if news.empty:
+            return {}
+        frame = pd.DataFrame(
+            {
+                "Ticker": news["Ticker"].values,
+                "Date": pd.to_datetime(news["Date"]).dt.date.values,
+                "score": self.score(news["Headline"]),
+            }
+        )
+        latest = frame.groupby("Ticker", sort=False)["Date"].transform("max")
+        means = (
+            frame[frame["Date"] == latest].groupby("Ticker", sort=False)["score"].mean()
+        )
+        order = frame["Ticker"].unique()
+        return {ticker: float(means[ticker]) for ticker in order if ticker in means}
+
+
+sentiment_engine = SentimentEngine()
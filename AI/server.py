@@ -0,0 +1,128 @@
+import os
+import time
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.routing import APIRoute
+
+import news
+import portfolio_rebalancing
+import portfolio_summarizer
+import tax_saving
+from cold_start import AI_PRELOAD, preload
+from http_client import http_client
+from llm_cache import llm_cache
+from llm_gateway import llm_gateway
+from market_data import price_cache
+from news_store import news_store
+from prewarm import market_signals, prewarmer
+from rebalance_state import rebalance_state
+from retry import metrics as retry_metrics
+from rss_feed import rss_feed
+from sentiment import sentiment_engine
+from singleflight import metrics as singleflight_metrics
+
+# Mounted at their original paths, so existing clients only change the port
+SERVICES = {
+    "news": news.app,
+    "portfolio_rebalancing": portfolio_rebalancing.app,
+    "portfolio_summarizer": portfolio_summarizer.app,
+    "tax_saving": tax_saving.app,
+}
+
+app = FastAPI()
+
+route_service = {}
+latency = {}
+for name, service in SERVICES.items():
+    # Brings the services' startup/shutdown handlers along with their routes
+    app.include_router(service.router)
+    for route in service.routes:
+        if isinstance(route, APIRoute):
+            route_service[route.path] = name
+    latency[name] = {
+        "requests": 0,
+        "errors": 0,
+        "total_seconds": 0.0,
+        "max_seconds": 0.0,
+    }
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    # Time to response headers, streaming bodies are not included
+    start = time.perf_counter()
+    response = await call_next(request)
+    name = route_service.get(request.url.path)
+    if name is not None:
+        elapsed = time.perf_counter() - start
+        stats = latency[name]
+        stats["requests"] += 1
+        stats["errors"] += response.status_code >= 500
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+    return response
+
+
+@app.get("/metrics/")
+async def metrics():
+    return {
+        "pid": os.getpid(),
+        "latency": {
+            name: {
+                **stats,
+                "mean_seconds": (
+                    stats["total_seconds"] / stats["requests"]
+                    if stats["requests"]
+                    else 0.0
+                ),
+            }
+            for name, stats in latency.items()
+        },
+        "price_cache": price_cache.stats,
+        "benchmarks": portfolio_rebalancing.benchmark_returns.stats,
+        "risk_models": portfolio_rebalancing.model_registry.stats,
+        "rebalance_state": rebalance_state.stats,
+        "market_signals": market_signals.stats,
+        "prewarm": prewarmer.stats,
+        "singleflight": singleflight_metrics(),
+        "llm": llm_gateway.stats,
+        "llm_cache": llm_cache.metrics(),
+        "retries": retry_metrics(),
+        "sentiment": sentiment_engine.stats,
+        "news_store": news_store.stats,
+        "rss_feed": rss_feed.stats,
+        "polarity_memo": portfolio_rebalancing.analyze_sentiment.cache_info()._asdict(),
+    }
+
+
+@app.on_event("startup")
+async def warm_up():
+    if AI_PRELOAD:
+        await asyncio.to_thread(preload)
+
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    await http_client.close()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run every AI service in one server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("AI_PORT", "8000")))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("AI_WORKERS", "1")),
+        help="worker processes, each with its own pools and in-memory caches",
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
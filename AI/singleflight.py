@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+_flights = {}
+
+
+class SingleFlight:
+    """Concurrent do() calls with the same key share one run of the coroutine.
+
+    The first caller starts it as a task and later callers await the same
+    task, so they all receive its result or its exception. The task is
+    shielded: a caller giving up does not cancel it for the others, but it
+    is cancelled once every caller has given up. Keys are forgotten once
+    the run finishes, this is not a cache.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._waiters = {}
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0, "cancelled": 0}
+        _flights[name] = self
+
+    async def do(self, key, func, *args, **kwargs):
+        self.stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["executed"] += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.stats["coalesced"] += 1
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    self.stats["cancelled"] += 1
+                    # Later callers start a new run instead of joining this one
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+                    task.cancel()
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Marks the exception retrieved if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+class ThreadSingleFlight:
+    """SingleFlight for blocking functions called from several threads."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0}
+        _flights[name] = self
+
+    def do(self, key, func, *args, **kwargs):
+        return self.do_many([key], lambda keys: {key: func(*args, **kwargs)})[key]
+
+    def do_many(self, keys, func):
+        """{key: result} of every key, running func(keys) only for keys not in flight.
+
+        func receives the keys this call runs and returns {key: result}, so
+        a batched download can still fetch all of them at once. Keys already
+        being run by another thread are waited for instead.
+        """
+        keys = list(dict.fromkeys(keys))
+        own = {}
+        shared = {}
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is None:
+                    own[key] = self._calls[key] = Future()
+                else:
+                    shared[key] = call
+            self.stats["calls"] += len(keys)
+            self.stats["executed"] += len(own)
+            self.stats["coalesced"] += len(shared)
+
+        results = {}
+        if own:
+            try:
+                results = func(list(own))
+                for key, call in own.items():
+                    call.set_result(results.get(key))
+            except BaseException as e:
+                for call in own.values():
+                    if not call.done():
+                        call.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key, call in own.items():
+                        if self._calls.get(key) is call:
+                            del self._calls[key]
+        return {
+            key: results.get(key) if key in own else shared[key].result()
+            for key in keys
+        }
+
+
+def metrics():
+    return {name: dict(flight.stats) for name, flight in _flights.items()}
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, Union
+
+from pydantic import BaseModel
+
+from lots import LotColumns
+from tax_saving import PastSales, Portfolio, optimize_lots, optimize_portfolio
+
+# Worker processes for batch runs, 0 optimizes in the calling process
+TAX_BATCH_WORKERS = int(os.getenv("TAX_BATCH_WORKERS", str(os.cpu_count() or 1)))
+# Users handed to a worker per task
+TAX_BATCH_CHUNK_SIZE = int(os.getenv("TAX_BATCH_CHUNK_SIZE", "64"))
+# Tasks submitted ahead of the one being written, bounds memory per batch
+TAX_BATCH_IN_FLIGHT = int(
+    os.getenv("TAX_BATCH_IN_FLIGHT", str(2 * max(TAX_BATCH_WORKERS, 1)))
+)
+# Request bodies larger than this are spooled to disk
+TAX_BATCH_SPOOL_SIZE = int(os.getenv("TAX_BATCH_SPOOL_SIZE", str(16 * 1024 * 1024)))
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+_process_pool = None
+
+
+class BatchRecord(BaseModel):
+    user_id: Union[int, str, None] = None
+    # One of portfolio or lots, lots are optimized with lot_method
+    portfolio: Optional[Portfolio] = None
+    lots: Optional[LotColumns] = None
+    lot_method: str = "fifo"
+    past_sales: PastSales = PastSales(sales=[])
+
+
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None and TAX_BATCH_WORKERS > 0:
+        # Started on the first batch request, next to running to_thread
+        # workers whose locks a forked child could inherit held
+        _process_pool = ProcessPoolExecutor(
+            max_workers=TAX_BATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def optimize_record(record, current_date):
+    """One output row for a raw NDJSON line or Arrow row dict."""
+    user_id = None
+    try:
+        if isinstance(record, (bytes, str)):
+            record = json.loads(record)
+        user_id = record.get("user_id")
+        # Arrow inputs may carry the nested documents as JSON strings
+        record = {
+            key: (
+                json.loads(value)
+                if isinstance(value, (bytes, str)) and key != "lot_method"
+                else value
+            )
+            for key, value in record.items()
+            if key != "user_id" and value is not None
+        }
+        parsed = BatchRecord(user_id=user_id, **record)
+        if parsed.lots is not None:
+            suggestions = optimize_lots(
+                parsed.lots, parsed.past_sales, current_date, parsed.lot_method
+            )
+        elif parsed.portfolio is not None:
+            suggestions = optimize_portfolio(
+                parsed.portfolio, parsed.past_sales, current_date
+            )
+        else:
+            raise ValueError("Record has neither portfolio nor lots")
+        return {"user_id": user_id, "suggestions": suggestions}
+    except Exception as e:
+        return {"user_id": user_id, "error": str(e)}
+
+
+def optimize_chunk(records, current_date):
+    """NDJSON output lines for a chunk of records, run inside a worker."""
+    return [json.dumps(optimize_record(r, current_date)) + "\n" for r in records]
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_ndjson(lines):
+    return (line for line in lines if line.strip())
+
+
+async def spool_body(request):
+    """Copy a request body to a temporary file, in memory while small.
+
+    The body has to be read before the response starts streaming, because
+    StreamingResponse consumes the request's receive channel.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=TAX_BATCH_SPOOL_SIZE)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def read_arrow(source):
+    """Row dicts of an Arrow IPC stream or file, one record batch at a time.
+
+    source is bytes, a path or a binary file object. pyarrow is only needed
+    for Arrow input.
+    """
+    import pyarrow as pa
+
+    if isinstance(source, (bytes, bytearray)):
+        source = pa.BufferReader(source)
+    elif isinstance(source, str):
+        source = pa.memory_map(source)
+    try:
+        reader = pa.ipc.open_stream(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        batches = iter(reader)
+    return (row for batch in batches for row in batch.to_pylist())
+
+
+def optimize_batch(
+    records,
+    current_date=None,
+    chunk_size=TAX_BATCH_CHUNK_SIZE,
+    max_in_flight=TAX_BATCH_IN_FLIGHT,
+):
+    """Yield NDJSON output lines for records, in input order.
+
+    Records are read lazily and at most max_in_flight chunks are queued in
+    the pool at once, so memory does not grow with the number of users.
+    """
+    current_date = current_date or datetime.now()
+    pool = get_process_pool()
+    if pool is None:
+        for chunk in chunked(records, chunk_size):
+            yield from optimize_chunk(chunk, current_date)
+        return
+
+    pending = deque()
+    for chunk in chunked(records, chunk_size):
+        pending.append(pool.submit(optimize_chunk, chunk, current_date))
+        if len(pending) >= max_in_flight:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+async def optimize_batch_async(
+    records,
+    current_date=None,
+    chunk_size=TAX_BATCH_CHUNK_SIZE,
+    max_in_flight=TAX_BATCH_IN_FLIGHT,
+):
+    """optimize_batch for the event loop, used by /tax_optimization/batch/."""
+    current_date = current_date or datetime.now()
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+
+    def submit(chunk):
+        if pool is None:
+            return asyncio.ensure_future(
+                asyncio.to_thread(optimize_chunk, chunk, current_date)
+            )
+        return loop.run_in_executor(pool, optimize_chunk, chunk, current_date)
+
+    # Reading the spooled body (and Arrow decoding) is blocking too
+    records = iter(records)
+    pending = deque()
+    try:
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(islice(records, chunk_size)))
+            if not chunk:
+                break
+            pending.append(submit(chunk))
+            if len(pending) >= max_in_flight:
+                for line in await pending.popleft():
+                    yield line
+        while pending:
+            for line in await pending.popleft():
+                yield line
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tax suggestions for many users, one NDJSON line per user."
+    )
+    parser.add_argument("input", help="NDJSON or Arrow file, - for NDJSON on stdin")
+    parser.add_argument("-o", "--output", help="NDJSON output file, default stdout")
+    parser.add_argument(
+        "--format",
+        choices=["auto", "ndjson", "arrow"],
+        default="auto",
+        help="auto picks arrow for .arrow/.arrows/.feather inputs",
+    )
+    parser.add_argument("--date", help="valuation date YYYY-MM-DD, default now")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt == "auto":
+        fmt = (
+            "arrow"
+            if args.input.endswith((".arrow", ".arrows", ".feather"))
+            else "ndjson"
+        )
+    current_date = datetime.strptime(args.date, "%Y-%m-%d") if args.date else None
+
+    source = None
+    if fmt == "arrow":
+        records = read_arrow(args.input)
+    else:
+        source = sys.stdin if args.input == "-" else open(args.input)
+        records = read_ndjson(source)
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for line in optimize_batch(records, current_date):
+            out.write(line)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if source is not None and source is not sys.stdin:
+            source.close()
+        shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    main()
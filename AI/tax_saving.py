@@ -1,11 +1,20 @@
 import json
-from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException
+import asyncio
+from datetime import datetime
+import numpy as np
+from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Dict
+from gains import asset_gains, gains_buckets, sales_gains
+from ltcg_harvest import LTCG_TAX_RATE, plan_harvest, plan_loss_offset
+from lots import LotColumns, LotStore
 
 app = FastAPI()
 
+TAX_FREE_LTCG_LIMIT = 100000
+
 
 class Asset(BaseModel):
     name: str
@@ -33,102 +42,248 @@ class PastSales(BaseModel):
     sales: List[Sale]
 
 
-def process_past_sales(past_sales_json: str):
-    past_sales = json.loads(past_sales_json)
-    total_ltcg = 0
-    total_stcg = 0
+def process_past_sales(past_sales: PastSales):
+    return gains_buckets(sales_gains(past_sales.sales))
 
-    one_year = timedelta(days=365)
 
-    for sale in past_sales["sales"]:
-        sale_date = datetime.strptime(sale["sale_date"], "%Y-%m-%d")
-        buy_date = datetime.strptime(sale["buy_date"], "%Y-%m-%d")
-        holding_period = sale_date - buy_date
-        profit = sale["sale_price"] - sale["buy_price"]
-        asset_type = sale["type"]
+def asset_suggestions(name, harvest=None, offset=None, donation=None, lot_ids=None):
+    """Suggestions for one holding: its harvest or loss pick, then donation.
 
-        if asset_type == "stock" and profit > 0:
-            if holding_period >= one_year:
-                total_ltcg += profit  # Long-term capital gains
-            else:
-                total_stcg += profit  # Short-term capital gains
+    harvest is (units, gain), offset (units, loss, excess LTCG) and donation
+    (units, profit) of the appreciated units. lot_ids, when the holding came
+    as lots, lists the lots the harvest or loss pick sells from.
+    """
+    tax_suggestions = []
 
-    return total_ltcg, total_stcg
+    if harvest is not None:
+        units, gain = harvest
+        tax_suggestions.append(
+            {
+                "asset": name,
+                "suggestion": f"Consider selling and buying back {units} units to realize {gain:.2f} of long-term capital gains (LTCG) within the tax-free limit",
+                "type": "profit",
+                "benefit": gain * LTCG_TAX_RATE,
+            }
+        )
 
+    if offset is not None:
+        units, loss, excess_ltcg = offset
+        tax_suggestions.append(
+            {
+                "asset": name,
+                "suggestion": f"Consider selling {units} units of {name} to book {loss:.2f} of long-term losses against taxable LTCG. Total excess: {excess_ltcg}",
+                "type": "taxes",
+                "benefit": loss * LTCG_TAX_RATE,
+            }
+        )
 
-def process_single_asset(
-    asset, current_date, tax_free_ltcg_limit, total_ltcg, ltcg_assets, tax_suggestions
-):
-    one_year = timedelta(days=365)
-
-    buy_price = asset["buy_price"]
-    current_price = asset["current_price"]
-    buy_date = datetime.strptime(asset["buy_date"], "%Y-%m-%d")
-    total_stocks = asset["total_stocks"]
-    profit_per_stock = current_price - buy_price
-    asset_type = asset["type"]
-
-    holding_period = current_date - buy_date
-
-    if asset_type == "stock" and profit_per_stock > 0 and holding_period >= one_year:
-        total_profit = profit_per_stock * total_stocks
-        total_ltcg += total_profit
-        ltcg_assets.append((asset, total_profit))
-
-        suggestion = {
-            "asset": asset["name"],
-            "suggestion": f"Consider selling {total_stocks} units to lock in long-term capital gains (LTCG)",
-            "type": "profit",
-            "benefit": total_profit,
-        }
-        tax_suggestions.append(suggestion)
-
-    if profit_per_stock > 0 and asset_type in ["stock", "bond"]:
-        total_profit = profit_per_stock * total_stocks
-        suggestion = {
-            "asset": asset["name"],
-            "suggestion": f"Consider donating {total_stocks} units of this appreciated asset to claim Section 80G deduction",
-            "type": "taxes",
-            "benefit": total_profit,
-        }
-        tax_suggestions.append(suggestion)
-
-    if total_ltcg > tax_free_ltcg_limit:
-        excess_ltcg = total_ltcg - tax_free_ltcg_limit
-        best_asset_to_sell = max(ltcg_assets, key=lambda x: x[1])[0]
+    if lot_ids is not None:
+        for suggestion in tax_suggestions:
+            suggestion["lots"] = lot_ids
 
+    if donation is not None:
+        units, total_profit = donation
         tax_suggestions.append(
             {
-                "asset": best_asset_to_sell["name"],
-                "suggestion": f"Consider selling {total_stocks} units of {best_asset_to_sell['name']} to minimize taxable LTCG. Total excess: {excess_ltcg}",
+                "asset": name,
+                "suggestion": f"Consider donating {units} units of this appreciated asset to claim Section 80G deduction",
                 "type": "taxes",
-                "benefit": excess_ltcg * 0.10,
+                "benefit": total_profit,
             }
         )
 
     return tax_suggestions
 
 
-@app.post("/tax_optimization/")
-async def tax_optimization(portfolio: Portfolio, past_sales: PastSales):
-    current_date = datetime.now()
-    tax_free_ltcg_limit = 100000
+def plan_ltcg(gains, quantities, total_ltcg, tax_free_ltcg_limit, chains=None):
+    """({index: (units, gain)} harvests, {index: (units, loss, excess)} offsets).
+
+    LTCG already realized this year decides the plan: while it is under the
+    tax-free limit, the largest long-term gains per unit are harvested to
+    fill what is left; once it is over, long-term losses are booked against
+    the excess.
+    """
+    headroom = tax_free_ltcg_limit - total_ltcg
+    if headroom > 0:
+        picks, _ = plan_harvest(gains, quantities, headroom, chains)
+        return {index: (units, gain) for index, units, gain in picks}, {}
+    if headroom < 0:
+        picks, _ = plan_loss_offset(gains, quantities, -headroom, chains)
+        return {}, {index: (units, loss, -headroom) for index, units, loss in picks}
+    return {}, {}
+
+
+def optimize_portfolio(
+    portfolio: Portfolio,
+    past_sales: PastSales,
+    current_date=None,
+    tax_free_ltcg_limit=TAX_FREE_LTCG_LIMIT,
+):
+    """Tax suggestions for one portfolio, shared by the single and batch paths."""
+    current_date = current_date or datetime.now()
+
+    total_ltcg, total_stcg = process_past_sales(past_sales)
+    gains = asset_gains(portfolio.assets, current_date)
+    quantities = [asset.total_stocks for asset in portfolio.assets]
+    harvests, offsets = plan_ltcg(gains, quantities, total_ltcg, tax_free_ltcg_limit)
 
-    total_ltcg, total_stcg = process_past_sales(past_sales.json())
     tax_suggestions = []
-    ltcg_assets = []
-
-    for asset in portfolio.assets:
-        tax_suggestions = process_single_asset(
-            asset.dict(),
-            current_date,
-            tax_free_ltcg_limit,
-            total_ltcg,
-            ltcg_assets,
-            tax_suggestions,
+    for index, (asset, profit_per_stock) in enumerate(
+        zip(portfolio.assets, gains["profit_per_unit"].tolist())
+    ):
+        donation = None
+        if profit_per_stock > 0 and asset.type in ["stock", "bond"]:
+            donation = (asset.total_stocks, profit_per_stock * asset.total_stocks)
+        tax_suggestions.extend(
+            asset_suggestions(
+                asset.name, harvests.get(index), offsets.get(index), donation
+            )
         )
 
-    return json.dumps(tax_suggestions, indent=4)
+    return tax_suggestions
+
+
+def _whole(units):
+    return int(units) if float(units).is_integer() else units
+
+
+def _by_symbol(store, picks):
+    """Sum {lot position: (units, amount, ...)} picks per symbol code."""
+    totals = {}
+    lot_ids = store.lots["lot_id"]
+    for position, (units, amount, *rest) in sorted(picks.items()):
+        code = int(store.lots["symbol"][position])
+        entry = totals.setdefault(code, [0, 0.0, rest, []])
+        entry[0] += units
+        entry[1] += amount
+        entry[3].append(int(lot_ids[position]))
+    return {
+        code: ((_whole(units), amount, *rest), ids)
+        for code, (units, amount, rest, ids) in totals.items()
+    }
+
+
+def optimize_lots(
+    lots: LotColumns,
+    past_sales: PastSales,
+    current_date=None,
+    lot_method="fifo",
+    tax_free_ltcg_limit=TAX_FREE_LTCG_LIMIT,
+):
+    """optimize_portfolio for holdings sent as tax lots, one entry per symbol.
+
+    Gains are computed for every lot at once. Under FIFO a symbol's lots can
+    only be harvested oldest first; "specific" lets any lot be picked.
+    """
+    current_date = current_date or datetime.now()
+
+    total_ltcg, total_stcg = process_past_sales(past_sales)
+    store = LotStore.from_payload(lots)
+    gains = store.gains(lots.current_price, current_date)
+    harvests, offsets = plan_ltcg(
+        gains,
+        store.lots["quantity"].tolist(),
+        total_ltcg,
+        tax_free_ltcg_limit,
+        store.chains(lot_method),
+    )
+    harvests = _by_symbol(store, harvests)
+    offsets = _by_symbol(store, offsets)
+
+    # Appreciated units per symbol, for the donation suggestion
+    codes = store.lots["symbol"]
+    appreciated = (gains["profit_per_unit"] > 0) & np.isin(
+        store.types[codes], ["stock", "bond"]
+    )
+    donate_units = np.bincount(
+        codes,
+        weights=np.where(appreciated, store.lots["quantity"], 0.0),
+        minlength=len(store.symbols),
+    )
+    donate_profit = np.bincount(
+        codes,
+        weights=np.where(appreciated, gains["profit"], 0.0),
+        minlength=len(store.symbols),
+    )
+
+    tax_suggestions = []
+    for code, symbol in enumerate(store.symbols):
+        harvest, harvest_lots = harvests.get(code, (None, None))
+        offset, offset_lots = offsets.get(code, (None, None))
+        donation = None
+        if donate_units[code] > 0:
+            donation = (_whole(donate_units[code]), float(donate_profit[code]))
+        tax_suggestions.extend(
+            asset_suggestions(
+                symbol, harvest, offset, donation, harvest_lots or offset_lots
+            )
+        )
+
+    return tax_suggestions
+
+
+@app.post("/tax_optimization/")
+async def tax_optimization(portfolio: Portfolio, past_sales: PastSales):
+    try:
+        suggestions = optimize_portfolio(portfolio, past_sales)
+    except ValueError as e:
+        # Malformed dates, see gains.to_days
+        raise HTTPException(status_code=400, detail=str(e))
+    return json.dumps(suggestions, indent=4)
+
+
+@app.post("/tax_optimization/lots/")
+async def tax_optimization_lots(
+    lots: LotColumns, past_sales: PastSales, lot_method: str = Body("fifo")
+):
+    """/tax_optimization/ for holdings sent column-wise as tax lots."""
+    try:
+        suggestions = optimize_lots(lots, past_sales, lot_method=lot_method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json.dumps(suggestions, indent=4)
+
+
+@app.post("/tax_optimization/batch/")
+async def tax_optimization_batch(request: Request):
+    """Suggestions for many users, streamed back as one NDJSON line per user.
+
+    The body is NDJSON with one {"user_id", "portfolio", "past_sales"} record
+    per line, or an Arrow IPC stream with those columns when sent as
+    application/vnd.apache.arrow.stream. See tax_batch.py.
+    """
+    from tax_batch import (
+        ARROW_MEDIA_TYPE,
+        optimize_batch_async,
+        read_arrow,
+        read_ndjson,
+        spool_body,
+    )
+
+    body = await spool_body(request)
+    if request.headers.get("content-type", "").startswith(ARROW_MEDIA_TYPE):
+        try:
+            records = await asyncio.to_thread(read_arrow, body)
+        except ImportError:
+            body.close()
+            raise HTTPException(status_code=415, detail="pyarrow is not installed")
+        except Exception as e:
+            body.close()
+            raise HTTPException(status_code=400, detail=f"Invalid Arrow input: {e}")
+    else:
+        records = read_ndjson(body)
+    return StreamingResponse(
+        optimize_batch_async(records),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(body.close),
+    )
+
+
+@app.on_event("shutdown")
+def shutdown_batch_pool():
+    from tax_batch import shutdown_process_pool
+
+    shutdown_process_pool()
 
 
 if __name__ == "__main__":
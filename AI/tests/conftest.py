@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The services import their siblings as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the module-level stores out of the working tree, spawned workers
+# inherit the variable
+os.environ.setdefault("AI_CACHE_DIR", tempfile.mkdtemp(prefix="ai-cache-"))
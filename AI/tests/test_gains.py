@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from gains import (
+    capital_gains,
+    gains_buckets,
+    reference_buckets,
+    sales_gains,
+    synthetic_sales,
+    to_days,
+)
+from tax_saving import PastSales
+
+
+def columnar_buckets(sales):
+    return gains_buckets(
+        capital_gains(
+            [s["buy_price"] for s in sales],
+            [s["sale_price"] for s in sales],
+            [s["buy_date"] for s in sales],
+            [s["sale_date"] for s in sales],
+            [s["type"] for s in sales],
+        )
+    )
+
+
+def test_totals_match_the_strptime_loop():
+    sales = synthetic_sales(5000, seed=7)
+    expected = reference_buckets(sales)
+    assert np.allclose(columnar_buckets(sales), expected)
+    assert np.allclose(
+        gains_buckets(sales_gains(PastSales(sales=sales).sales)), expected
+    )
+
+
+def test_unpadded_and_boundary_dates_match_the_strptime_loop():
+    sales = [
+        # Exactly one year apart is long term
+        {"buy_date": "2023-01-05", "sale_date": "2024-01-05"},
+        {"buy_date": "2023-1-6", "sale_date": "2024-1-5"},
+        # 365 days, across a leap day
+        {"buy_date": "2024-02-29", "sale_date": "2025-02-28"},
+    ]
+    sales = [
+        {**sale, "buy_price": 10.0, "sale_price": 15.0, "type": "stock"}
+        for sale in sales
+    ]
+    assert columnar_buckets(sales) == reference_buckets(sales) == (10.0, 5.0)
+
+
+@pytest.mark.parametrize(
+    "bad", ["", "2024", "2024-01", "2024-02-30", "2024-13-01", "05-01-2024", "x"]
+)
+def test_bad_dates_raise_like_strptime(bad):
+    sales = [
+        {
+            "buy_price": 10.0,
+            "sale_price": 15.0,
+            "buy_date": bad,
+            "sale_date": "2024-06-01",
+            "type": "stock",
+        }
+    ]
+    with pytest.raises(ValueError):
+        reference_buckets(sales)
+    with pytest.raises(ValueError, match="does not match format"):
+        columnar_buckets(sales)
+
+
+def test_to_days_accepts_dates_and_datetimes():
+    from datetime import date, datetime
+
+    days = to_days([date(2024, 1, 5), datetime(2024, 1, 6, 12)])
+    assert days.tolist() == to_days(["2024-01-05", "2024-01-06"]).tolist()
@@ -0,0 +1,71 @@
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+
+def test_key_ignores_input_formatting(tmp_path):
+    cache = LLMCache(tmp_path / "llm.sqlite")
+    assert cache.key("m", "t", '{"b": 1, "a": 2}') == cache.key(
+        "m", "t", '{ "a": 2,\n  "b": 1 }'
+    )
+    assert cache.key("m", "t", "some  text") == cache.key("m", "t", "some text")
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = LLMCache(tmp_path / "llm.sqlite", ttl=60)
+    cache.set("k", "value")
+
+    clock.now += 59
+    assert cache.get("k") == "value"
+
+    # Reading does not extend the TTL
+    clock.now += 1
+    assert cache.get("k") is None
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = LLMCache(tmp_path / "llm.sqlite", max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+        clock.now += 1
+    # Reading a makes b the least recently used entry
+    cache.get("a")
+
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.stats["evictions"] == 1
+
+
+def test_expired_entries_are_evicted_first(tmp_path, clock):
+    cache = LLMCache(tmp_path / "llm.sqlite", ttl=60, max_entries=2)
+    cache.set("old", "old")
+    clock.now += 61
+    cache.set("a", "a")
+    cache.set("b", "b")
+
+    cache.evict()
+
+    assert cache.stats["evictions"] == 1
+    assert cache.get("a") == "a"
+    assert cache.get("b") == "b"
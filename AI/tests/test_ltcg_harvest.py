@@ -0,0 +1,81 @@
+from math import floor
+
+import numpy as np
+import pytest
+
+from ltcg_harvest import plan_harvest, select_units, synthetic_gains
+
+
+def scan_select(per_unit, quantities, budget, chains=None):
+    """select_units as a max() scan over the chain heads on every pick."""
+    chains = chains or [[i] for i in range(len(per_unit))]
+    heads = [0] * len(chains)
+    positive = [amount for amount in per_unit if amount > 0]
+    if not positive:
+        return [], budget
+    smallest = min(positive)
+
+    picks = []
+    while budget >= smallest:
+        candidates = [
+            (per_unit[chain[head]], number)
+            for number, (chain, head) in enumerate(zip(chains, heads))
+            if head < len(chain)
+            and per_unit[chain[head]] > 0
+            and quantities[chain[head]] > 0
+        ]
+        if not candidates:
+            break
+        amount, number = max(candidates, key=lambda c: (c[0], -c[1]))
+        index = chains[number][heads[number]]
+        units = min(quantities[index], floor(budget / amount))
+        if units > 0:
+            picks.append((index, units, units * amount))
+            budget -= units * amount
+        # A lot sold in part ends its chain, as the next lot cannot go first
+        heads[number] = (
+            heads[number] + 1 if units == quantities[index] else len(chains[number])
+        )
+    return picks, budget
+
+
+def test_small_budget_fills_with_smaller_lots():
+    per_unit = [50.0, 30.0, 0.0, -10.0, 20.0]
+    quantities = [3, 2, 5, 5, 10]
+    picks, left = select_units(per_unit, quantities, 215.0)
+    assert picks == [(0, 3, 150.0), (1, 2, 60.0)]
+    assert left == 5.0
+
+
+def test_fifo_chain_sells_oldest_lot_first():
+    per_unit = [5.0, 40.0, 30.0]
+    quantities = [2, 1, 1]
+    # Lot 1 is only reachable once lot 0 is sold in full
+    picks, left = select_units(per_unit, quantities, 80.0, chains=[[0, 1], [2]])
+    assert picks == [(2, 1, 30.0), (0, 2, 10.0), (1, 1, 40.0)]
+    assert left == 0.0
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("headroom", [1_000.0, 100_000.0, 5_000_000.0])
+def test_harvest_matches_the_quadratic_scan(seed, headroom):
+    gains, quantities = synthetic_gains(400, seed)
+    eligible = gains["is_stock"] & gains["long_term"]
+    per_unit = np.where(eligible, gains["profit_per_unit"], 0.0).tolist()
+
+    assert plan_harvest(gains, quantities, headroom) == scan_select(
+        per_unit, quantities.tolist(), headroom
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_chained_harvest_matches_the_quadratic_scan(seed):
+    gains, quantities = synthetic_gains(400, seed)
+    bounds = np.unique(np.random.default_rng(seed).integers(1, 400, 60))
+    chains = [range(a, b) for a, b in zip([0, *bounds], [*bounds, 400])]
+    eligible = gains["is_stock"] & gains["long_term"]
+    per_unit = np.where(eligible, gains["profit_per_unit"], 0.0).tolist()
+
+    assert plan_harvest(gains, quantities, 100_000.0, chains) == scan_select(
+        per_unit, quantities.tolist(), 100_000.0, chains
+    )
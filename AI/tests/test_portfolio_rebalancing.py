@@ -0,0 +1,61 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+import portfolio_rebalancing
+from portfolio_rebalancing import suggest_portfolio_async
+
+
+def synthetic_prices(seed, rows=400):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, rows))
+    index = pd.bdate_range("2023-01-02", periods=rows)
+    return pd.DataFrame(
+        {"Close": close, "Volume": rng.integers(1_000, 10_000, rows)}, index=index
+    )
+
+
+ARTICLES = [{"title": "Shares rise", "description": "A good quarter for the firm"}]
+
+
+async def fetch(query, num_articles=5):
+    return ARTICLES
+
+
+async def fetch_many(queries, num_articles=5):
+    return [ARTICLES for _ in queries]
+
+
+def test_concurrent_path_runs_in_default_pool(monkeypatch):
+    items = [
+        {"symbol": "TCS", "type": "stock", "quantity": 10.0},
+        {"symbol": "INFY", "type": "stock", "quantity": 5.0},
+    ]
+    frames = {
+        (item["symbol"], item["type"]): synthetic_prices(seed)
+        for seed, item in enumerate(items)
+    }
+    monkeypatch.setattr(portfolio_rebalancing, "fetch_bulk", lambda keys: frames)
+    monkeypatch.setattr(portfolio_rebalancing.rss_feed, "fetch", fetch)
+    monkeypatch.setattr(portfolio_rebalancing.rss_feed, "fetch_many", fetch_many)
+
+    signals = {}
+
+    async def run():
+        # Holds a to_thread worker busy while the pool starts, as a request does
+        busy = asyncio.to_thread(portfolio_rebalancing.logging.info, "busy")
+        suggested, _ = await asyncio.gather(
+            asyncio.wait_for(suggest_portfolio_async(items, 0.5, signals), 120), busy
+        )
+        return suggested
+
+    try:
+        suggested = asyncio.run(run())
+        assert portfolio_rebalancing.get_process_pool() is not None
+    finally:
+        portfolio_rebalancing.shutdown_process_pool()
+
+    assert [item.symbol for item in suggested] == ["TCS", "INFY"]
+    assert all(entry["predicted_risk"] is not None for entry in signals.values())
+    assert all(item.risk_percentage > 0 for item in suggested)
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import price_cache
+from price_cache import PriceCache
+
+START = datetime(2024, 1, 1)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(price_cache, "time", clock)
+    return clock
+
+
+def bars(start, days):
+    index = pd.date_range(start, periods=days, freq="D")
+    return pd.DataFrame(
+        {"Close": range(1, days + 1), "Volume": [100.0] * days}, index=index
+    )
+
+
+class Downloads:
+    def __init__(self, days=5):
+        self.days = days
+        self.calls = []
+
+    def __call__(self, since):
+        self.calls.append(since)
+        return bars(since, self.days)
+
+
+def test_series_is_served_until_the_ttl_then_refreshed(tmp_path, clock):
+    cache = PriceCache(tmp_path / "prices.sqlite", ttl=60)
+    download = Downloads()
+
+    first = cache.fetch("TCS", "stock", START, download)
+    assert list(first["Close"]) == [1, 2, 3, 4, 5]
+
+    clock.now += 59
+    cache.fetch("TCS", "stock", START, download)
+    assert len(download.calls) == 1
+
+    clock.now += 2
+    refreshed = cache.fetch("TCS", "stock", START, download)
+    # Only the bars from the last cached date onwards are downloaded
+    assert download.calls[1] == datetime(2024, 1, 5)
+    assert len(refreshed) == 9
+    assert cache.stats == {"hits": 1, "refreshes": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_series_are_evicted_over_max_rows(tmp_path, clock):
+    cache = PriceCache(tmp_path / "prices.sqlite", max_rows=10)
+    for symbol in ("A", "B"):
+        cache.fetch(symbol, "stock", START, Downloads())
+        clock.now += 1
+    # Reading A makes B the least recently used series
+    cache.read("A", "stock")
+    clock.now += 1
+
+    cache.fetch("C", "stock", START, Downloads())
+
+    assert cache.read("B", "stock").empty
+    assert len(cache.read("A", "stock")) == 5
+    assert len(cache.read("C", "stock")) == 5
+    assert cache.stats["evictions"] == 1
+
+
+def test_idle_series_are_evicted(tmp_path, clock):
+    cache = PriceCache(tmp_path / "prices.sqlite", max_idle=100)
+    cache.fetch("A", "stock", START, Downloads())
+    clock.now += 101
+
+    cache.fetch("B", "stock", START, Downloads())
+
+    assert cache.read("A", "stock").empty
+    assert len(cache.read("B", "stock")) == 5
+    assert cache.stats["evictions"] == 1
@@ -0,0 +1,84 @@
+import pytest
+
+import rebalance_state
+from rebalance_state import RebalanceState
+
+TCS = ("TCS", "stock")
+INFY = ("INFY", "stock")
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rebalance_state, "time", clock)
+    return clock
+
+
+def test_signals_are_reused_after_a_restart(tmp_path, clock):
+    path = str(tmp_path / "state.sqlite")
+    RebalanceState(path).save(
+        "u1",
+        {
+            TCS: {"predicted_risk": 0.2, "asset_sentiment": 0.1},
+            # Not stored, so it is computed again on the next run
+            INFY: {"predicted_risk": None},
+        },
+    )
+
+    clock.now += 60
+    # A new instance on the same file, as after a service restart
+    state = RebalanceState(path)
+    signals = state.load("u1", [TCS, INFY])
+
+    assert signals == {
+        TCS: {
+            "predicted_risk": 0.2,
+            "fetched_at": 1_000_000.0,
+            "asset_sentiment": 0.1,
+            "sentiment_at": 1_000_000.0,
+        },
+        INFY: {},
+    }
+    assert state.stats["risk_reused"] == 1
+    assert state.stats["risk_computed"] == 1
+    assert RebalanceState(path).load("u2", [TCS]) == {TCS: {}}
+
+
+def test_risk_and_sentiment_expire_separately(tmp_path, clock):
+    path = str(tmp_path / "state.sqlite")
+    RebalanceState(path).save(
+        "u1", {TCS: {"predicted_risk": 0.2, "asset_sentiment": 0.1}}
+    )
+
+    clock.now += 150
+    state = RebalanceState(path, risk_max_age=200, sentiment_max_age=100)
+    assert state.load("u1", [TCS]) == {
+        TCS: {"predicted_risk": 0.2, "fetched_at": 1_000_000.0}
+    }
+
+    clock.now += 100
+    assert state.load("u1", [TCS]) == {TCS: {}}
+
+
+def test_saved_timestamps_are_kept_and_dropped_holdings_forgotten(tmp_path, clock):
+    path = str(tmp_path / "state.sqlite")
+    state = RebalanceState(path)
+    state.save("u1", {TCS: {"predicted_risk": 0.2}, INFY: {"predicted_risk": 0.3}})
+
+    clock.now += 60
+    # The next run reused TCS's risk and no longer holds INFY
+    reused = state.load("u1", [TCS])
+    state.save("u1", reused)
+
+    assert RebalanceState(path).load("u1", [TCS, INFY]) == {
+        TCS: {"predicted_risk": 0.2, "fetched_at": 1_000_000.0},
+        INFY: {},
+    }
@@ -0,0 +1,68 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def test_coalesced_callers_share_one_run():
+    flight = SingleFlight("test_shared")
+    runs = []
+
+    async def work(value):
+        runs.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", work, 21) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert runs == [21]
+    assert flight.stats["coalesced"] == 4
+
+
+def test_run_survives_while_a_caller_waits():
+    flight = SingleFlight("test_survives")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leaver = asyncio.create_task(flight.do("k", work))
+        stayer = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        leaver.cancel()
+        return await stayer
+
+    assert asyncio.run(main()) == "done"
+    assert flight.stats["cancelled"] == 0
+
+
+def test_run_is_cancelled_when_every_caller_gives_up():
+    flight = SingleFlight("test_cancelled")
+    started = []
+    cancelled = []
+
+    async def work():
+        started.append(True)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        results = await asyncio.gather(
+            asyncio.wait_for(flight.do("k", work), 0.01),
+            asyncio.wait_for(flight.do("k", work), 0.02),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+        await asyncio.sleep(0)
+        # A new caller starts a fresh run rather than joining the cancelled one
+        assert "k" not in flight._calls
+
+    asyncio.run(main())
+    assert started == [True]
+    assert cancelled == [True]
+    assert flight.stats["cancelled"] == 1